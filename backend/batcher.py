@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Any, List, Set, Tuple
+
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+import services
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("XAI_PREDICT_BATCH_WINDOW_MS", "5"))  # How long a batch gathers rows
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("XAI_PREDICT_MAX_BATCH_SIZE", "256"))  # Flush early at this many rows
+
+# Rows waiting per model: model_id -> [(row, future)]; only touched from the event loop thread
+_PENDING: Dict[str, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+_TIMERS: Dict[str, asyncio.TimerHandle] = {}
+# Running flushes; the event loop only keeps weak references to tasks
+_FLUSHES: Set[asyncio.Task] = set()
+
+async def predict(model_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Predicts one row, sharing a single model call with rows other requests submit meanwhile."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    batch = _PENDING.setdefault(model_id, [])
+    batch.append((row, future))
+    if len(batch) >= PREDICT_MAX_BATCH_SIZE:
+        _start_flush(model_id)
+    elif len(batch) == 1:
+        _TIMERS[model_id] = loop.call_later(PREDICT_BATCH_WINDOW_MS / 1000, _start_flush, model_id)
+    return await future
+
+def pending_rows() -> int:
+    """Rows currently waiting for their batch to run."""
+    return sum(len(batch) for batch in list(_PENDING.values()))
+
+def _start_flush(model_id: str):
+    timer = _TIMERS.pop(model_id, None)
+    if timer is not None:
+        timer.cancel()
+    batch = _PENDING.pop(model_id, None)
+    if batch:
+        task = asyncio.get_running_loop().create_task(_flush(model_id, batch))
+        _FLUSHES.add(task)
+        task.add_done_callback(_FLUSHES.discard)
+
+async def _flush(model_id: str, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+    rows = [row for row, _ in batch]
+    try:
+        results = await run_in_threadpool(services.predict_service, model_id, pd.DataFrame(rows))
+    except Exception as e:
+        if len(batch) == 1:
+            _resolve(batch, exception=e)
+            return
+        # One bad row must not fail its neighbours, so retry the rows one by one
+        logger.warning(f"Batched prediction of {len(batch)} rows for model {model_id} failed ({e}); predicting rows individually")
+        for item in batch:
+            await _flush(model_id, [item])
+        return
+    _resolve(batch, results=results)
+
+def _resolve(batch, results=None, exception=None):
+    for i, (_, future) in enumerate(batch):
+        if future.done():
+            # The caller went away
+            continue
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(results[i])
@@ -0,0 +1,254 @@
+"""Benchmarks the train, explain and feedback hot paths on synthetic data.
+
+Run from the backend directory, e.g.:
+
+    python benchmark.py --rows 1000 10000 --cardinality 5 50 --output results.json
+
+Every run reports p50/p95/p99 latency, throughput and peak RSS as JSON, so two runs can be diffed.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+from typing import Dict, Any, List, Callable
+
+import numpy as np
+import pandas as pd
+
+import explain_workers
+import explanation_store
+import model_store
+import services
+from models import ModelType, TrainRequest, ExplainRequest, FeedbackRequest
+
+logger = logging.getLogger(__name__)
+
+PROBLEM_TYPES = ("classification", "regression")
+# The linear model each problem type trains; ExactLinear and KernelExplainer are timed on it
+LINEAR_MODELS = {"classification": "logistic_regression", "regression": "linear_regression"}
+PREDICT_ROWS = 256
+
+def make_dataset(rows: int, numeric_columns: int, categorical_columns: int, cardinality: int, problem_type: str = "classification", seed: int = 0) -> pd.DataFrame:
+    """A synthetic dataset whose target depends on a few numeric and categorical columns."""
+    rng = np.random.default_rng(seed)
+    data = {f"num_{i}": rng.normal(0, 1 + i, rows) for i in range(numeric_columns)}
+    levels = np.array([f"level_{j}" for j in range(cardinality)])
+    for i in range(categorical_columns):
+        data[f"cat_{i}"] = levels[rng.zipf(1.5, rows) % cardinality]
+    df = pd.DataFrame(data)
+    signal = rng.normal(0, 0.5, rows)
+    if numeric_columns:
+        signal += df["num_0"].to_numpy()
+    if categorical_columns:
+        signal += (df["cat_0"] == "level_0").to_numpy()
+    df["target"] = np.where(signal > np.median(signal), "yes", "no") if problem_type == "classification" else signal * 10
+    return df
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def summarize(name: str, latencies: List[float], wall_seconds: float, **extra) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds and throughput for one measured operation."""
+    ms = np.asarray(latencies) * 1000
+    return {
+        "name": name, "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3), "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_s": round(len(ms) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(), **extra,
+    }
+
+def measure(name: str, fn: Callable[[int], Any], repeat: int, **extra) -> Dict[str, Any]:
+    """Calls fn(i) repeat times in sequence and summarizes the latencies."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t)
+    return summarize(name, latencies, time.perf_counter() - started, **extra)
+
+def check_lime_feature_names(model_id: str, point: Dict[str, Any], categorical_columns: List[str]):
+    """Fails the run if LIME reports a feature SHAP doesn't, for a row in each reference category and one unseen category.
+
+    The reference category is the one the dense one-hot encoder drops; unseen categories
+    have no column unless the sparse encoder groups them into an infrequent one.
+    """
+    model_data = services.get_model_data(model_id)
+    names = set(model_data["preprocessor"].get_feature_names_out())
+    encoders = model_data["preprocessor"].named_transformers_
+    rows = [dict(point, **{col: "never_seen_category" for col in categorical_columns})]
+    if "cat" in encoders:
+        reference = {col: categories[0] for col, categories in zip(encoders["cat"].feature_names_in_, encoders["cat"].steps[-1][1].categories_)}
+        rows.append(dict(point, **reference))
+    for row in rows:
+        lime = services.explain_model_service(ExplainRequest(model_id=model_id, data_point=row))["lime"]["lime_explanation"]
+        unknown = sorted(set(lime) - names)
+        if unknown:
+            raise RuntimeError(f"LIME reported features SHAP doesn't have for model {model_id}: {unknown}")
+
+def bench_services(df: pd.DataFrame, dataset: Dict[str, Any], repeat: int, explain_repeat: int) -> List[Dict[str, Any]]:
+    """Service-level timings for one dataset: inspect, train per model type, predict, explain and feedback."""
+    results = []
+    linear = LINEAR_MODELS[dataset["problem_type"]]
+    csv = df.to_csv(index=False).encode()
+    results.append(measure("inspect_csv_service", lambda i: services.inspect_csv_service(csv), repeat, dataset=dataset))
+
+    model_ids = {}
+    for model_type in ModelType:
+        request = TrainRequest(model_type=model_type, target_column="target")
+        try:
+            # Vary one byte per run so the fingerprint cache does not turn repeats into lookups
+            result = measure(f"train_model_service[{model_type.value}]", lambda i: model_ids.__setitem__(model_type.value, services.train_model_service(csv + b"\n" * i, request)["model_id"]), max(1, repeat // 5), dataset=dataset)
+        except ValueError as e:
+            # logistic_regression only fits classification targets, linear_regression only regression ones
+            logger.info(f"Skipping {model_type.value}: {e}")
+            continue
+        results.append(result)
+    tuned = TrainRequest(model_type=ModelType.random_forest, target_column="target", tune=True)
+    results.append(measure("train_model_service[random_forest tuned]", lambda i: services.train_model_service(csv + b"\n" * (i + 1000), tuned), 1, dataset=dataset))
+
+    features = df.drop(columns=["target"])
+    points = features.head(explain_repeat).to_dict(orient="records")
+    categorical_columns = [col for col in df.columns if col.startswith("cat_")]
+    sparse = TrainRequest(model_type=linear, target_column="target", categorical_encoding="sparse")
+    checked = dict(model_ids, **{f"{linear} sparse": services.train_model_service(csv + b"\n" * 2000, sparse)["model_id"]})
+    for model_id in checked.values():
+        check_lime_feature_names(model_id, points[0], categorical_columns)
+
+    rows = features.head(PREDICT_ROWS)
+    for model_type in ("random_forest", linear):
+        model_id = model_ids[model_type]
+        results.append(measure(f"predict_service[{model_type}]", lambda i: services.predict_service(model_id, rows), repeat, dataset=dataset, rows=len(rows)))
+        results.append(measure(f"explain_batch_service[{model_type}]", lambda i: services.explain_batch_service(model_id, rows, include_lime=False), max(1, repeat // 5), dataset=dataset, rows=len(rows)))
+
+    explain_paths = [
+        ("TreeExplainer", "random_forest", None, {}), ("ExactLinear", linear, None, {}),
+        ("KernelExplainer", linear, 1, {}), ("KernelExplainer adaptive", linear, None, {"shap_tolerance": 0.005}),
+    ]
+    for path, model_type, rating, options in explain_paths:
+        model_id = model_ids.get(model_type)
+        if model_id is None:
+            continue
+        if rating is not None:
+            # Low ratings switch a model to KernelExplainer, the path used when no exact explainer applies
+            services.handle_feedback_service(FeedbackRequest(model_id=model_id, rating=rating, explanation_type="shap"))
+        services.explain_model_service(ExplainRequest(model_id=model_id, data_point=points[0], **options))  # builds the cached explainers
+        explained = services.explain_model_service(ExplainRequest(model_id=model_id, data_point=points[0], **options))
+        explanation_store.clear()  # time the explainers, not the stored-explanation lookups
+        results.append(measure(f"explain_model_service[{path}]", lambda i: services.explain_model_service(ExplainRequest(model_id=model_id, data_point=points[i % len(points)], **options)), explain_repeat, dataset=dataset, model_type=model_type, explainer_type=explained["shap"]["explainer_type"]))
+
+    feedback_model = model_ids.get("decision_tree")
+    if feedback_model is not None:
+        results.append(measure("handle_feedback_service", lambda i: services.handle_feedback_service(FeedbackRequest(model_id=feedback_model, rating=1 + i % 5, comment="benchmark comment about clarity")), repeat * 5, dataset=dataset))
+    return results
+
+async def _http_load(app, method: str, path: str, payloads: List[Dict[str, Any]], concurrency: int) -> List[float]:
+    import httpx
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        async def call(payload):
+            async with semaphore:
+                t = time.perf_counter()
+                response = await client.request(method, path, json=payload)
+                latencies.append(time.perf_counter() - t)
+                response.raise_for_status()
+        await asyncio.gather(*(call(p) for p in payloads))
+    return latencies
+
+def bench_http(df: pd.DataFrame, dataset: Dict[str, Any], requests: int, concurrency: int) -> List[Dict[str, Any]]:
+    """Concurrent load against the FastAPI app through an in-process ASGI client."""
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        logger.warning("httpx is not installed; skipping HTTP benchmarks")
+        return []
+    import main
+
+    csv = df.to_csv(index=False).encode()
+    model_id = services.train_model_service(csv, TrainRequest(model_type=ModelType.random_forest, target_column="target"))["model_id"]
+    points = df.drop(columns=["target"]).head(requests).to_dict(orient="records")
+    points = [points[i % len(points)] for i in range(requests)]
+    targets = [
+        ("POST /models/{model_id}/predict", "POST", f"/models/{model_id}/predict", [{"data_point": p} for p in points]),
+        ("POST /explain", "POST", "/explain", [{"model_id": model_id, "data_point": p} for p in points]),
+    ]
+    results = []
+    for name, method, path, payloads in targets:
+        started = time.perf_counter()
+        latencies = asyncio.run(_http_load(main.app, method, path, payloads, concurrency))
+        results.append(summarize(f"http {name}", latencies, time.perf_counter() - started, dataset=dataset, concurrency=concurrency))
+    return results
+
+def run(args) -> Dict[str, Any]:
+    results = []
+    for rows in args.rows:
+        for columns in args.columns:
+            for cardinality in args.cardinality:
+                categorical = max(1, columns // 2)
+                for problem_type in args.problem_types:
+                    dataset = {"rows": rows, "numeric_columns": columns - categorical, "categorical_columns": categorical, "cardinality": cardinality, "problem_type": problem_type}
+                    logger.info(f"Benchmarking dataset {dataset}")
+                    df = make_dataset(rows, columns - categorical, categorical, cardinality, problem_type, seed=args.seed)
+                    results.extend(bench_services(df, dataset, args.repeat, args.explain_repeat))
+                    if not args.skip_http:
+                        results.extend(bench_http(df, dataset, args.http_requests, args.concurrency))
+    return {
+        "started_at": args.started_at, "finished_at": datetime.now().isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "started_at")},
+        "peak_rss_mb": peak_rss_mb(), "results": results,
+    }
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Row counts of the synthetic datasets")
+    parser.add_argument("--columns", type=int, nargs="+", default=[8], help="Feature counts; half of them categorical")
+    parser.add_argument("--cardinality", type=int, nargs="+", default=[5, 50], help="Distinct values per categorical column")
+    parser.add_argument("--problem-types", choices=PROBLEM_TYPES, nargs="+", default=list(PROBLEM_TYPES), help="Target kinds of the synthetic datasets")
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions of inspect and training runs")
+    parser.add_argument("--explain-repeat", type=int, default=20, help="Explanations timed per explainer path")
+    parser.add_argument("--http-requests", type=int, default=200, help="Requests per HTTP endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent in-flight HTTP requests")
+    parser.add_argument("--skip-http", action="store_true", help="Only run the service-level benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.started_at = datetime.now().isoformat()
+
+    warnings.filterwarnings("ignore")
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    # Keep benchmark models and parsed datasets out of the real model store; set before any worker starts
+    store_dir = None
+    if "XAI_MODEL_STORE_DIR" not in os.environ:
+        store_dir = tempfile.mkdtemp(prefix="xai-bench-store-")
+        model_store.set_store_dir(store_dir)
+    try:
+        report = json.dumps(run(args), indent=2)
+    finally:
+        explain_workers.shutdown()
+        if store_dir is not None:
+            shutil.rmtree(store_dir, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+        logger.info(f"Benchmark report written to {args.output}")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+
+from models import ExplainRequest
+import explainers
+import jobs
+import metrics
+import services
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+EXPLAIN_WORKERS = int(os.getenv("XAI_EXPLAIN_WORKERS", "2"))  # 0 explains in the API process's threadpool
+EXPLAIN_TIMEOUT_SECONDS = float(os.getenv("XAI_EXPLAIN_TIMEOUT_SECONDS", "60"))  # Default per-request deadline
+
+_LOCK = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_warm_model_ids: List[str] = []  # Models every new worker loads before taking requests
+
+def _init_worker(model_ids: List[str]):
+    """Worker process initializer: imports the explanation libraries and warms up model_ids."""
+    explainers.load_libraries()
+    for model_id in model_ids:
+        try:
+            services.warm_up_model(model_id)
+        except Exception as e:
+            logger.warning(f"Could not warm up model {model_id} in explanation worker: {e}")
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _LOCK:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXPLAIN_WORKERS, mp_context=jobs.get_mp_context(), initializer=_init_worker, initargs=(list(_warm_model_ids),))
+            logger.info(f"Started explanation pool with {EXPLAIN_WORKERS} workers")
+        return _executor
+
+def start(model_ids: List[str] = ()):
+    """Starts every explanation worker, warming up model_ids in each, and waits until one accepts work.
+
+    Workers only take requests once their warm-up has finished, so none is served cold.
+    """
+    global _warm_model_ids
+    if EXPLAIN_WORKERS <= 0:
+        return
+    _warm_model_ids = list(model_ids)
+    executor = _get_executor()
+    # Workers are spawned while none is idle, so this many concurrent calls start all of them
+    futures = [executor.submit(os.getpid) for _ in range(EXPLAIN_WORKERS)]
+    futures[0].result()
+
+def _reset_executor(broken: ProcessPoolExecutor):
+    global _executor
+    with _LOCK:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def _run_explanation(model_id: str, data_point: Dict[str, Any], params: Dict[str, Any], sampling: Optional[Dict[str, Any]], deadline: float) -> Tuple[Tuple[Dict[str, Any], Dict[str, Any], bool], List]:
+    """Entry point in a worker process: explains one data point and returns it with its timing spans.
+
+    Models are opened from the model store, whose training frames are memory-mapped, and
+    stay resident with their explainers, so later requests only ship the data point and
+    parameters. Requests still queued past their deadline are dropped without any work.
+    """
+    if time.time() > deadline:
+        raise TimeoutError("Explanation deadline passed before a worker was free.")
+    # Feedback lives in the API process; explainers built for older parameters are stale
+    explainers.invalidate_explainers(model_id, keep_params=params)
+    with metrics.collect() as spans:
+        result = services.explain_data_point(model_id, data_point, params, sampling)
+    return result, spans
+
+def _explain_in_worker(timeout: float):
+    def compute(model_id: str, data_point: Dict[str, Any], params: Dict[str, Any], sampling: Optional[Dict[str, Any]]):
+        executor = _get_executor()
+        deadline = time.time() + timeout
+        try:
+            future = executor.submit(_run_explanation, model_id, data_point, params, sampling, deadline)
+        except BrokenProcessPool:
+            logger.warning("Explanation pool was broken; starting a new one")
+            _reset_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(_run_explanation, model_id, data_point, params, sampling, deadline)
+        try:
+            result, spans = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # A running explanation cannot be interrupted; it finishes and warms the worker's caches
+            future.cancel()
+            raise TimeoutError(f"Explanation did not finish within {timeout:g} seconds.")
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            raise
+        for stage, seconds, _ in spans:
+            metrics.record_span(stage, seconds)
+        return result
+    return compute
+
+def explain(request: ExplainRequest) -> Dict[str, Any]:
+    """Explains one data point on the worker pool, raising TimeoutError past the request's deadline.
+
+    Stored explanations are answered in the API process without a round trip. Without
+    workers, or for models that never reached the model store, the work stays in-process
+    and the deadline is not enforced.
+    """
+    model_data = services.get_model_data(request.model_id)
+    if EXPLAIN_WORKERS <= 0 or model_data is None or model_data.get("stored_bytes") is None:
+        return services.explain_model_service(request)
+    timeout = request.timeout_seconds or EXPLAIN_TIMEOUT_SECONDS
+    return services.explain_model_service(request, compute=_explain_in_worker(timeout))
+
+def submit(fn, *args) -> Optional[Future]:
+    """Runs fn(*args) on the worker pool for background work, or returns None without workers."""
+    if EXPLAIN_WORKERS <= 0:
+        return None
+    executor = _get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning("Explanation pool was broken; starting a new one")
+        _reset_executor(executor)
+        return _get_executor().submit(fn, *args)
+
+def shutdown():
+    """Stops the explanation worker pool."""
+    global _executor
+    with _LOCK:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,358 @@
+import copy
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# shap, LIME and scikit-learn are imported on first use so that starting the API stays fast
+import metrics
+import model_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Explainer artifacts per model: model_id -> {params_key: artifacts}, kept in LRU order
+EXPLAINER_CACHE: "OrderedDict[str, Dict[Tuple, Dict[str, Any]]]" = OrderedDict()
+MAX_CACHED_EXPLAINER_MODELS = int(os.getenv("XAI_EXPLAINER_CACHE_SIZE", "16"))
+MAX_CACHED_EXPLAINER_BYTES = int(os.getenv("XAI_EXPLAINER_CACHE_BYTES", str(1024 ** 3)))  # Approximate array memory
+KERNEL_BACKGROUND_ROWS = int(os.getenv("XAI_KERNEL_BACKGROUND_ROWS", "5000"))  # Training rows summarized into the KernelExplainer background
+LIME_RANDOM_STATE = 42
+UNKNOWN_CATEGORY = 'unknown'  # What out-of-range LIME codes decode to
+
+_CACHE_LOCK = threading.Lock()
+# model_id -> [lock, builds using it]; removed once no build holds or waits for it
+_BUILD_LOCKS: Dict[str, List[Any]] = {}
+
+def params_key(params: Dict[str, Any]) -> Tuple:
+    """Hashable key for a parameter set returned by adjust_explanation_parameters."""
+    return tuple(sorted(params.items()))
+
+class ExactLinearExplainer:
+    """Closed-form SHAP values for linear models: coef * (x - background mean).
+
+    Classifiers are explained on their decision function, i.e. in log-odds for logistic
+    regression and in margin units for linear SVMs. Mirrors the shap explainer interface.
+    """
+    def __init__(self, model, background, problem_type: str):
+        # Linear SVMs fitted on sparse input keep sparse coefficients
+        coef = np.atleast_2d(to_dense(model.coef_).astype(float))
+        intercept = np.atleast_1d(np.asarray(model.intercept_, dtype=float))
+        # Binary classifiers and single-target regressors have one row; multiclass logistic
+        # regression explains the class at index 1, like the other explainers
+        row = 1 if coef.shape[0] > 1 else 0
+        self.coef = coef[row]
+        self.mean = np.asarray(background.mean(axis=0), dtype=float).ravel()
+        self.expected_value = float(self.coef @ self.mean + intercept[row])
+        self.output_space = "raw" if problem_type == "regression" else ("log-odds" if hasattr(model, "predict_log_proba") and not hasattr(model, "support_") else "margin")
+
+    def shap_values(self, X, **kwargs):
+        X = X.toarray() if hasattr(X, "toarray") else np.asarray(X, dtype=float)
+        return (X - self.mean) * self.coef
+
+def is_exact_linear(model, problem_type: str) -> bool:
+    """Whether a fitted estimator's output is a linear function of its inputs that ExactLinearExplainer covers."""
+    try:
+        coef = np.atleast_2d(to_dense(model.coef_))
+    except AttributeError:
+        # Non-linear SVM kernels raise here
+        return False
+    if problem_type == "regression" or coef.shape[0] == 1:
+        return True
+    # One-vs-one SVM coefficients don't map to a single class output
+    return not hasattr(model, "support_")
+
+def load_libraries():
+    """Imports shap, LIME and the scikit-learn modules that training and explanations load on first use."""
+    import shap  # noqa: F401
+    import lime.lime_tabular  # noqa: F401
+    import sklearn.compose, sklearn.ensemble, sklearn.impute, sklearn.linear_model  # noqa: F401
+    import sklearn.model_selection, sklearn.preprocessing, sklearn.svm, sklearn.tree  # noqa: F401
+
+def build_shap_explainer(model, problem_type: str, preprocessor, X_train: pd.DataFrame, use_model_explainer: bool, shap_samples: int) -> Tuple[Any, str]:
+    """A SHAP explainer for a fitted estimator and the name of its type.
+
+    Tree and linear models get exact explainers; everything else, or any model when
+    use_model_explainer is off, uses KernelExplainer on a weighted k-means summary of
+    shap_samples background rows. Only as much of X_train is transformed as the explainer
+    needs: none for trees, and at most KERNEL_BACKGROUND_ROWS rows for KernelExplainer.
+    """
+    import shap
+    if use_model_explainer and hasattr(model, 'feature_importances_'):
+        return shap.TreeExplainer(model), "TreeExplainer"
+    if use_model_explainer and is_exact_linear(model, problem_type):
+        with metrics.span("explainer.transform_background"):
+            X_train_transformed = preprocessor.transform(X_train)
+        explainer = ExactLinearExplainer(model, X_train_transformed, problem_type)
+        return explainer, f"ExactLinear ({explainer.output_space})"
+    if len(X_train) > KERNEL_BACKGROUND_ROWS:
+        X_train = X_train.sample(KERNEL_BACKGROUND_ROWS, random_state=0)
+    with metrics.span("explainer.transform_background"):
+        background = to_dense(preprocessor.transform(X_train)).astype(float)
+    # Centroids weighted by cluster size cover the data better than a random sample of the same size;
+    # k-means can't find more clusters than there are distinct rows
+    clusters = min(shap_samples, len(np.unique(background, axis=0)))
+    background_summary = shap.kmeans(background, clusters) if len(background) > clusters else background
+    predict_fn = model.predict_proba if problem_type == "classification" and hasattr(model, 'predict_proba') else model.predict
+    return shap.KernelExplainer(predict_fn, background_summary), "KernelExplainer"
+
+def build_explainer_artifacts(model_data: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds everything an explanation needs that depends only on the model and parameters."""
+    import lime.lime_tabular
+    from sklearn.preprocessing import LabelEncoder
+    pipeline = model_data["pipeline"]
+    X_train, _ = model_store.training_split(model_data, "train")
+    feature_names = model_data["feature_names"]
+    problem_type = model_data["problem_type"]
+    categorical_features = model_data["categorical_features"]
+    preprocessor = pipeline.named_steps['preprocessor']
+    model = pipeline.named_steps['classifier']
+
+    try:
+        transformed_feature_names = list(preprocessor.get_feature_names_out())
+    except Exception:
+        transformed_feature_names = [f"feature_{i}" for i in range(max(s.stop for s in preprocessor.output_indices_.values()))]
+
+    artifacts: Dict[str, Any] = {"transformed_feature_names": transformed_feature_names, "feature_map": transformed_feature_map(preprocessor)}
+    try:
+        with metrics.span("explainer.shap_build"):
+            artifacts["shap_explainer"], artifacts["shap_explainer_type"] = build_shap_explainer(model, problem_type, preprocessor, X_train, params["use_tree_explainer"], params["shap_samples"])
+    except Exception as e:
+        logger.error(f"SHAP explainer construction failed: {e}")
+        artifacts["shap_error"] = str(e)
+
+    with metrics.span("explainer.lime_build"):
+        try:
+            X_train_numeric = X_train.copy()
+            label_encoders = {}
+            for col in categorical_features:
+                if col in X_train_numeric.columns:
+                    le = LabelEncoder()
+                    X_train_numeric[col] = le.fit_transform(X_train_numeric[col].astype(str))
+                    label_encoders[col] = le
+            X_train_numeric.fillna(0, inplace=True)
+            artifacts["label_encoders"] = label_encoders
+            try:
+                artifacts["lime_transform"] = build_lime_transform(model_data, label_encoders)
+            except Exception as e:
+                logger.warning(f"Falling back to the full pipeline for LIME predictions: {e}")
+                artifacts["lime_transform"] = None
+            artifacts["lime_explainer"] = lime.lime_tabular.LimeTabularExplainer(training_data=X_train_numeric.values, feature_names=feature_names, class_names=['0', '1'] if problem_type == "classification" else None, mode=problem_type, discretize_continuous=params["discretize_continuous"], random_state=LIME_RANDOM_STATE)
+        except Exception as e:
+            logger.error(f"LIME explainer construction failed: {e}")
+            artifacts["lime_error"] = str(e)
+    return artifacts
+
+def to_dense(values) -> np.ndarray:
+    """A NumPy array of a preprocessor's output, which is a sparse matrix for sparse encodings."""
+    return values.toarray() if hasattr(values, "toarray") else np.asarray(values)
+
+def transformed_feature_map(preprocessor) -> Dict[str, Dict[str, Any]]:
+    """For each input column, the name of the transformer encoding it and whether it is one-hot encoded.
+
+    One-hot columns also list the categories grouped into their infrequent column.
+    """
+    from sklearn.preprocessing import OneHotEncoder
+    feature_map = {}
+    for name, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, str):
+            continue
+        encoder = transformer.steps[-1][1] if hasattr(transformer, "steps") else transformer
+        onehot = isinstance(encoder, OneHotEncoder)
+        infrequent = getattr(encoder, "infrequent_categories_", None) if onehot else None
+        for i, col in enumerate(columns):
+            grouped = infrequent[i] if infrequent is not None and infrequent[i] is not None else []
+            feature_map[col] = {"prefix": name, "onehot": onehot, "infrequent": {str(v) for v in grouped}}
+    return feature_map
+
+def build_lime_transform(model_data: Dict[str, Any], label_encoders: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Precomputes how LIME's label-encoded rows map into the preprocessor's output space.
+
+    Numeric columns go through the fitted scaler's mean and scale. Each categorical column, whatever
+    its encoder, gets a lookup table with one row per label code, plus a last row for out-of-range
+    codes, holding that value's contribution to the output columns it touches within the encoded
+    block. Returns None for preprocessors of any other shape, which then use the full pipeline.
+    """
+    from sklearn.preprocessing import StandardScaler
+    preprocessor = model_data["preprocessor"]
+    position = {name: i for i, name in enumerate(model_data["feature_names"])}
+    width = max(s.stop for s in preprocessor.output_indices_.values())
+    numeric, categorical = [], []
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == 'drop' or len(columns) == 0:
+            continue
+        out = preprocessor.output_indices_[name]
+        if name == 'num' and isinstance(transformer.steps[-1][1], StandardScaler):
+            scaler = transformer.steps[-1][1]
+            numeric.append({"columns": [position[c] for c in columns], "out": out, "mean": scaler.mean_, "scale": scaler.scale_})
+        elif name != 'num' and all(c in label_encoders for c in columns):
+            reference = pd.DataFrame({c: [label_encoders[c].classes_[0]] for c in columns})
+            base = to_dense(transformer.transform(reference))[0]
+            tables = []
+            for c in columns:
+                values = list(label_encoders[c].classes_) + [UNKNOWN_CATEGORY]
+                probe = reference.loc[np.zeros(len(values), dtype=int)].reset_index(drop=True)
+                probe[c] = values
+                table = to_dense(transformer.transform(probe)) - base
+                # Encoders work per column, so a table is zero outside its column's own outputs
+                touched = np.flatnonzero(np.any(table != 0, axis=0))
+                start, stop = (int(touched[0]), int(touched[-1]) + 1) if len(touched) else (0, 0)
+                tables.append((position[c], start, stop, table[:, start:stop]))
+            categorical.append({"out": out, "base": base, "tables": tables})
+        else:
+            return None
+    return {"width": width, "numeric": numeric, "categorical": categorical}
+
+def lime_rows_to_model_input(lime_transform: Dict[str, Any], x: np.ndarray) -> np.ndarray:
+    """Maps label-encoded LIME rows to the estimator's input, handling out-of-range codes per element."""
+    result = np.zeros((len(x), lime_transform["width"]))
+    for block in lime_transform["numeric"]:
+        values = x[:, block["columns"]].astype(float)
+        if block["mean"] is not None:
+            values -= block["mean"]
+        if block["scale"] is not None:
+            values /= block["scale"]
+        result[:, block["out"]] = values
+    for block in lime_transform["categorical"]:
+        encoded = np.repeat(block["base"][np.newaxis, :], len(x), axis=0)
+        for column, start, stop, table in block["tables"]:
+            codes = x[:, column].astype(int)
+            codes[(codes < 0) | (codes >= len(table) - 1)] = len(table) - 1
+            encoded[:, start:stop] += table[codes]
+        result[:, block["out"]] = encoded
+    return result
+
+def get_explainer_artifacts(model_id: str, model_data: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns cached explainer artifacts for a model and parameter set, building them on first use."""
+    key = params_key(params)
+    with _CACHE_LOCK:
+        entry = EXPLAINER_CACHE.get(model_id)
+        if entry is not None and key in entry:
+            EXPLAINER_CACHE.move_to_end(model_id)
+            return entry[key]
+        build_lock = _BUILD_LOCKS.setdefault(model_id, [threading.Lock(), 0])
+        build_lock[1] += 1
+
+    # Only one thread builds a given model's explainers; the others wait and reuse the result
+    try:
+        with build_lock[0]:
+            with _CACHE_LOCK:
+                entry = EXPLAINER_CACHE.get(model_id)
+                if entry is not None and key in entry:
+                    EXPLAINER_CACHE.move_to_end(model_id)
+                    return entry[key]
+            logger.info(f"Building explainers for model {model_id} with parameters {params}")
+            artifacts = build_explainer_artifacts(model_data, params)
+            artifacts["nbytes"] = _artifacts_bytes(artifacts)
+            with _CACHE_LOCK:
+                EXPLAINER_CACHE.setdefault(model_id, {})[key] = artifacts
+                EXPLAINER_CACHE.move_to_end(model_id)
+                # The model just built for always stays, even on its own over budget
+                while len(EXPLAINER_CACHE) > 1 and (len(EXPLAINER_CACHE) > MAX_CACHED_EXPLAINER_MODELS or _total_bytes() > MAX_CACHED_EXPLAINER_BYTES):
+                    evicted_id, _ = EXPLAINER_CACHE.popitem(last=False)
+                    logger.info(f"Evicted explainers for model {evicted_id}")
+            return artifacts
+    finally:
+        with _CACHE_LOCK:
+            build_lock[1] -= 1
+            if build_lock[1] == 0 and _BUILD_LOCKS.get(model_id) is build_lock:
+                del _BUILD_LOCKS[model_id]
+
+def invalidate_explainers(model_id: str, keep_params: Dict[str, Any] = None):
+    """Drops cached explainers for a model, optionally keeping those built for keep_params."""
+    with _CACHE_LOCK:
+        entry = EXPLAINER_CACHE.get(model_id)
+        if entry is None:
+            return
+        if keep_params is None:
+            EXPLAINER_CACHE.pop(model_id, None)
+            return
+        keep_key = params_key(keep_params)
+        for key in [k for k in entry if k != keep_key]:
+            del entry[key]
+
+def _array_bytes(obj) -> int:
+    """NumPy bytes held directly by an object or its attributes, one level deep."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    return sum(value.nbytes for value in getattr(obj, "__dict__", {}).values() if isinstance(value, np.ndarray))
+
+def _artifacts_bytes(artifacts: Dict[str, Any]) -> int:
+    """Approximate array memory held by one set of explainer artifacts."""
+    explainer = artifacts.get("shap_explainer")
+    total = _array_bytes(explainer) + _array_bytes(getattr(explainer, "data", None))
+    total += _array_bytes(artifacts.get("lime_explainer"))
+    lime_transform = artifacts.get("lime_transform")
+    if lime_transform is not None:
+        for block in lime_transform["categorical"]:
+            total += block["base"].nbytes + sum(table.nbytes for _, _, _, table in block["tables"])
+    return total
+
+def _total_bytes() -> int:
+    # Called with _CACHE_LOCK held
+    return sum(artifacts["nbytes"] for entry in EXPLAINER_CACHE.values() for artifacts in entry.values())
+
+def cached_bytes(model_id: str) -> int:
+    """Approximate array memory held by a model's cached explainers."""
+    with _CACHE_LOCK:
+        return sum(artifacts["nbytes"] for artifacts in EXPLAINER_CACHE.get(model_id, {}).values())
+
+def fresh_shap_explainer(artifacts: Dict[str, Any]):
+    """Shallow copy of the cached SHAP explainer so concurrent calls don't share per-call state."""
+    explainer = artifacts["shap_explainer"]
+    return copy.copy(explainer) if artifacts["shap_explainer_type"] == "KernelExplainer" else explainer
+
+def fresh_lime_explainer(artifacts: Dict[str, Any]):
+    """Shallow copy of the cached LIME explainer with a reset random state.
+
+    This keeps each explanation identical to one from a newly built explainer and
+    stops concurrent requests from advancing a shared random state.
+    """
+    from sklearn.utils import check_random_state
+    explainer = copy.copy(artifacts["lime_explainer"])
+    random_state = check_random_state(LIME_RANDOM_STATE)
+    explainer.random_state = random_state
+    explainer.base = copy.copy(explainer.base)
+    explainer.base.random_state = random_state
+    if explainer.discretizer is not None:
+        explainer.discretizer = copy.copy(explainer.discretizer)
+        explainer.discretizer.random_state = random_state
+    return explainer
+
+class _CapturedPerturbations(Exception):
+    """Raised from a stand-in prediction function to hand LIME's perturbations back to the caller."""
+    def __init__(self, inverse):
+        super().__init__("perturbations captured")
+        self.inverse = inverse
+
+def _capture_perturbations(inverse):
+    raise _CapturedPerturbations(inverse)
+
+def explain_lime_rows(artifacts: Dict[str, Any], rows: np.ndarray, predict_fn, num_features: int, num_samples: int) -> List[Any]:
+    """Runs LIME for each row while calling predict_fn once for all rows' perturbations.
+
+    A first pass only collects each row's perturbations. A second pass replays the same
+    random state and hands back slices of one batched prediction, so every explanation is
+    identical to explaining that row on its own.
+    """
+    if len(rows) == 1:
+        return [fresh_lime_explainer(artifacts).explain_instance(rows[0], predict_fn, num_features=num_features, num_samples=num_samples)]
+
+    perturbations = []
+    for row in rows:
+        try:
+            fresh_lime_explainer(artifacts).explain_instance(row, _capture_perturbations, num_features=num_features, num_samples=num_samples)
+        except _CapturedPerturbations as captured:
+            perturbations.append(captured.inverse)
+    predictions = predict_fn(np.vstack(perturbations))
+
+    lime_exps = []
+    offset = 0
+    for row, inverse in zip(rows, perturbations):
+        row_predictions = predictions[offset:offset + len(inverse)]
+        offset += len(inverse)
+        lime_exps.append(fresh_lime_explainer(artifacts).explain_instance(row, lambda _x, p=row_predictions: p, num_features=num_features, num_samples=num_samples))
+    return lime_exps
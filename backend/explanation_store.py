@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+EXPLANATION_CACHE_SIZE = int(os.getenv("XAI_EXPLANATION_CACHE_SIZE", "10000"))  # Max stored explanations
+EXPLANATION_CACHE_BYTES = int(os.getenv("XAI_EXPLANATION_CACHE_BYTES", str(64 * 1024 ** 2)))  # Max serialized size
+EXPLANATION_TTL_SECONDS = float(os.getenv("XAI_EXPLANATION_TTL_SECONDS", "3600"))
+
+# explanation_id -> entry, least recently used first; ids are content hashes of the request
+EXPLANATION_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+STATS = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+_LOCK = threading.Lock()
+_bytes = 0
+
+def _canonical(value):
+    """JSON-stable form of a data point value: numbers as floats, NumPy scalars unwrapped."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def explanation_key(model_id: str, data_point: Dict[str, Any], params: Dict[str, Any]) -> str:
+    """Content address of an explanation: the model, the prepared data point and the parameters used."""
+    payload = {
+        "model_id": model_id,
+        "data_point": {str(k): _canonical(v) for k, v in data_point.items()},
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _remove(explanation_id: str) -> Dict[str, Any]:
+    global _bytes
+    entry = EXPLANATION_CACHE.pop(explanation_id)
+    _bytes -= entry["bytes"]
+    return entry
+
+def _expire(now: float):
+    # Stops at the first live entry; expired entries behind it go when read or evicted
+    while EXPLANATION_CACHE:
+        explanation_id, entry = next(iter(EXPLANATION_CACHE.items()))
+        if entry["expires_at"] > now:
+            break
+        _remove(explanation_id)
+        STATS["expirations"] += 1
+
+def get(explanation_id: str, count: bool = True) -> Optional[Dict[str, Any]]:
+    """A stored explanation that hasn't expired, or None. count=False skips the hit/miss counters."""
+    now = time.monotonic()
+    with _LOCK:
+        entry = EXPLANATION_CACHE.get(explanation_id)
+        if entry is not None and entry["expires_at"] <= now:
+            _remove(explanation_id)
+            STATS["expirations"] += 1
+            entry = None
+        if count:
+            STATS["hits" if entry is not None else "misses"] += 1
+        if entry is None:
+            return None
+        EXPLANATION_CACHE.move_to_end(explanation_id)
+        return entry["explanation"]
+
+def put(explanation_id: str, explanation: Dict[str, Any]):
+    """Stores an explanation, then evicts expired and least recently used entries over budget."""
+    global _bytes
+    size = len(json.dumps(explanation, default=str))
+    now = time.monotonic()
+    with _LOCK:
+        if explanation_id in EXPLANATION_CACHE:
+            _remove(explanation_id)
+        EXPLANATION_CACHE[explanation_id] = {"explanation": explanation, "bytes": size, "expires_at": now + EXPLANATION_TTL_SECONDS}
+        _bytes += size
+        _expire(now)
+        while len(EXPLANATION_CACHE) > 1 and (len(EXPLANATION_CACHE) > EXPLANATION_CACHE_SIZE or _bytes > EXPLANATION_CACHE_BYTES):
+            _remove(next(iter(EXPLANATION_CACHE)))
+            STATS["evictions"] += 1
+
+def clear():
+    """Drops every stored explanation, e.g. before timing uncached explanations."""
+    global _bytes
+    with _LOCK:
+        EXPLANATION_CACHE.clear()
+        _bytes = 0
+
+def stored_bytes() -> int:
+    """Serialized size of all stored explanations."""
+    return _bytes
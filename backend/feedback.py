@@ -0,0 +1,52 @@
+from collections import deque
+from typing import Dict, Any, Optional
+
+RECENT_RATINGS = 10  # Ratings kept per explanation type for the recency-weighted reliability score
+SUGGESTION_KEYWORDS = ("confusing", "unclear", "slow", "time")
+ALL_TYPES = "both"
+
+def new_stats() -> Dict[str, Any]:
+    """Empty running aggregates for one model's feedback."""
+    return {"count": 0, "rating_sum": 0, "by_type": {}, "keywords": {keyword: 0 for keyword in SUGGESTION_KEYWORDS}}
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"count": 0, "rating_sum": 0, "recent": deque(maxlen=RECENT_RATINGS)}
+
+def record(stats: Dict[str, Any], rating: int, explanation_type: Optional[str], comment: Optional[str]):
+    """Folds one feedback entry into the aggregates in constant time.
+
+    Ratings count towards their own explanation type and towards "both", which
+    covers every entry.
+    """
+    stats["count"] += 1
+    stats["rating_sum"] += rating
+    types = {ALL_TYPES, explanation_type}
+    for key in types:
+        bucket = stats["by_type"].setdefault(key, _new_bucket())
+        bucket["count"] += 1
+        bucket["rating_sum"] += rating
+        bucket["recent"].append(rating)
+    if comment:
+        text = comment.lower()
+        for keyword in SUGGESTION_KEYWORDS:
+            if keyword in text:
+                stats["keywords"][keyword] += 1
+
+def average_rating(stats: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Mean rating over all feedback, or None without feedback."""
+    if not stats or not stats["count"]:
+        return None
+    return stats["rating_sum"] / stats["count"]
+
+def reliability_score(stats: Optional[Dict[str, Any]], explanation_type: Optional[str] = ALL_TYPES) -> float:
+    """Recency-weighted normalized rating over the last RECENT_RATINGS entries of a type; 0.5 without feedback."""
+    bucket = stats["by_type"].get(explanation_type) if stats else None
+    if not bucket or not bucket["recent"]:
+        return 0.5
+    total_weight = 0
+    weighted_sum = 0
+    for i, rating in enumerate(reversed(bucket["recent"])):
+        weight = (i + 1) / 10
+        weighted_sum += (rating - 1) / 4 * weight
+        total_weight += weight
+    return weighted_sum / total_weight
@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+import explain_workers
+import explainers
+import model_store
+import services
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+GLOBAL_SAMPLE_SIZE = int(os.getenv("XAI_GLOBAL_SAMPLE_SIZE", "500"))  # Rows explained by exact (tree, linear) explainers
+GLOBAL_KERNEL_ROWS = int(os.getenv("XAI_GLOBAL_KERNEL_ROWS", "100"))  # Row budget for KernelExplainer
+GLOBAL_KERNEL_NSAMPLES = int(os.getenv("XAI_GLOBAL_KERNEL_NSAMPLES", "200"))  # Model evaluations per row
+GLOBAL_KERNEL_BACKGROUND = int(os.getenv("XAI_GLOBAL_KERNEL_BACKGROUND", "50"))
+GLOBAL_EXPLANATION_WORKERS = int(os.getenv("XAI_GLOBAL_EXPLANATION_WORKERS", "1"))
+SPLITS = ("train", "test")
+
+# Computed summaries per model: model_id -> {"split:sample_size": result}, persisted with the model
+GLOBAL_EXPLANATION_CACHE: Dict[str, Dict[str, Dict[str, Any]]] = {}
+# Summaries being computed: (model_id, key) -> future
+PENDING: Dict[tuple, Future] = {}
+
+_LOCK = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=GLOBAL_EXPLANATION_WORKERS, thread_name_prefix="global-shap")
+    return _executor
+
+def _cache_key(split: str, sample_size: int) -> str:
+    return f"{split}:{sample_size}"
+
+def stratified_sample(y: pd.Series, size: int, problem_type: str) -> np.ndarray:
+    """Positions of up to size rows, stratified by class or, for regression, by target quantile."""
+    from sklearn.model_selection import train_test_split
+    positions = np.arange(len(y))
+    if size >= len(y):
+        return positions
+    strata = y.astype(str) if problem_type == "classification" else pd.qcut(y.astype(float), q=min(10, size), labels=False, duplicates='drop')
+    try:
+        sample, _ = train_test_split(positions, train_size=size, stratify=np.asarray(strata), random_state=42)
+    except ValueError:
+        # Strata too small to split; fall back to a plain random sample
+        sample, _ = train_test_split(positions, train_size=size, random_state=42)
+    return np.sort(sample)
+
+def compute_global_explanation(model_id: str, model_data: Dict[str, Any], split: str, sample_size: int) -> Dict[str, Any]:
+    """Mean |SHAP| per transformed feature over a stratified sample of one split."""
+    started = time.perf_counter()
+    preprocessor = model_data["preprocessor"]
+    model = model_data["model"]
+    problem_type = model_data["problem_type"]
+    X_train, _ = model_store.training_split(model_data, "train")
+    X, y = model_store.training_split(model_data, split)
+
+    explainer, explainer_type = explainers.build_shap_explainer(model, problem_type, preprocessor, X_train, True, GLOBAL_KERNEL_BACKGROUND)
+    # KernelExplainer costs nsamples model calls per row, so it gets a smaller row budget
+    rows = min(sample_size, GLOBAL_KERNEL_ROWS) if explainer_type == "KernelExplainer" else sample_size
+    sample = stratified_sample(y, rows, problem_type)
+    X_sample = preprocessor.transform(X.iloc[sample])
+
+    artifacts = {"shap_explainer": explainer, "shap_explainer_type": explainer_type}
+    shap_values, base_value = services.compute_shap_values(artifacts, X_sample, nsamples=GLOBAL_KERNEL_NSAMPLES)
+    try:
+        feature_names = list(preprocessor.get_feature_names_out())
+    except Exception:
+        feature_names = [f"feature_{i}" for i in range(X_sample.shape[1])]
+    mean_abs_shap = np.abs(shap_values).mean(axis=0)
+    order = np.argsort(-mean_abs_shap)
+    return {
+        "model_id": model_id, "split": split, "sample_size": sample_size, "rows": int(len(sample)),
+        "explainer_type": explainer_type, "base_value": base_value,
+        "mean_abs_shap": {feature_names[j]: float(mean_abs_shap[j]) for j in order},
+        "computed_at": datetime.now().isoformat(), "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+
+def _stored(model_id: str) -> Dict[str, Dict[str, Any]]:
+    with _LOCK:
+        cached = GLOBAL_EXPLANATION_CACHE.get(model_id)
+    if cached is None:
+        cached = model_store.load_artifact(model_id, "global_explanations") or {}
+        with _LOCK:
+            cached = GLOBAL_EXPLANATION_CACHE.setdefault(model_id, cached)
+    return cached
+
+def _compute_and_store(model_id: str, split: str, sample_size: int) -> Dict[str, Any]:
+    """Computes one global explanation and merges it into the model's stored ones.
+
+    Runs on an explanation worker process when there are any, so SHAP stays off the API process.
+    """
+    model_data = services.get_model_data(model_id)
+    if model_data is None:
+        raise ValueError("Model not found. Please train the model first.")
+    result = compute_global_explanation(model_id, model_data, split, sample_size)
+    key = _cache_key(split, sample_size)
+    try:
+        with model_store.artifact_lock(model_id, "global_explanations"):
+            stored = model_store.load_artifact(model_id, "global_explanations") or {}
+            stored[key] = result
+            model_store.save_artifact(model_id, "global_explanations", stored)
+    except Exception as e:
+        logger.error(f"Could not persist global explanation for model {model_id}: {e}")
+    logger.info(f"Global explanation for model {model_id} ({key}) computed in {result['duration_seconds']}s")
+    return result
+
+def _finished(model_id: str, key: str, future: Future):
+    with _LOCK:
+        PENDING.pop((model_id, key), None)
+        # Models evicted meanwhile reload their summaries from the store
+        results = GLOBAL_EXPLANATION_CACHE.get(model_id)
+        if results is not None and not future.cancelled() and future.exception() is None:
+            results[key] = future.result()
+
+def schedule(model_id: str, split: str = "train", sample_size: int = GLOBAL_SAMPLE_SIZE) -> Future:
+    """Starts computing a model's global explanation in the background, unless it is already running.
+
+    Persisted models are explained on the explanation worker pool; the rest, or all of them
+    without workers, on a background thread.
+    """
+    sample_size = min(sample_size, GLOBAL_SAMPLE_SIZE)
+    key = _cache_key(split, sample_size)
+    _stored(model_id)
+    model_data = services.get_model_data(model_id)
+    persisted = model_data is not None and model_data.get("stored_bytes") is not None
+    with _LOCK:
+        future = PENDING.get((model_id, key))
+        if future is not None:
+            return future
+        future = explain_workers.submit(_compute_and_store, model_id, split, sample_size) if persisted else None
+        if future is None:
+            future = _get_executor().submit(_compute_and_store, model_id, split, sample_size)
+        PENDING[(model_id, key)] = future
+    future.add_done_callback(lambda done: _finished(model_id, key, done))
+    return future
+
+def get_global_explanation(model_id: str, split: str = "train", sample_size: int = GLOBAL_SAMPLE_SIZE, wait: bool = False) -> Optional[Dict[str, Any]]:
+    """The cached global explanation. If it has not been computed yet it is scheduled, and
+    None is returned unless wait is set. sample_size is capped at GLOBAL_SAMPLE_SIZE."""
+    if split not in SPLITS:
+        raise ValueError(f"split must be one of {', '.join(SPLITS)}.")
+    if sample_size < 1:
+        raise ValueError("sample_size must be at least 1.")
+    if services.get_model_data(model_id) is None:
+        raise KeyError("Model not found. Please train the model first.")
+    sample_size = min(sample_size, GLOBAL_SAMPLE_SIZE)
+    result = _stored(model_id).get(_cache_key(split, sample_size))
+    if result is None:
+        future = schedule(model_id, split, sample_size)
+        if wait:
+            result = future.result()
+    return result
+
+def forget(model_id: str):
+    """Drops a model's summaries from memory; they stay in the model store."""
+    with _LOCK:
+        GLOBAL_EXPLANATION_CACHE.pop(model_id, None)
+
+services.on_model_evicted(forget)
+
+def shutdown():
+    """Stops the background executor without waiting for running summaries."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
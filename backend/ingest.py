@@ -0,0 +1,106 @@
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import tempfile
+from typing import Dict, Any, Optional, Tuple, Union
+
+import pandas as pd
+from fastapi import UploadFile
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("XAI_UPLOAD_DIR", tempfile.gettempdir())
+UPLOAD_CHUNK_SIZE = int(os.getenv("XAI_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+CSV_SAMPLE_ROWS = int(os.getenv("XAI_CSV_SAMPLE_ROWS", "10000"))  # Rows read to infer column dtypes
+CSV_ENGINE = os.getenv("XAI_CSV_ENGINE", "")  # Set to "pyarrow" to parse full files with pyarrow
+
+CsvSource = Union[str, bytes]
+
+async def spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """Copies an upload to a temporary file in chunks and returns its path and content fingerprint.
+
+    The caller owns the file and must remove it with discard_upload.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="xai-upload-", suffix=".csv", dir=UPLOAD_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        discard_upload(path)
+        raise
+    return path, digest.hexdigest()
+
+def fingerprint(source: CsvSource) -> str:
+    """SHA-256 of a CSV's bytes, the key under which its parsed form is cached."""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def discard_upload(path: Optional[str]):
+    """Removes a spooled upload, ignoring files that are already gone."""
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _open(source: CsvSource):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+def _drop_unnamed(df: pd.DataFrame) -> pd.DataFrame:
+    # FIX: Remove the "Unnamed: 0" column that pandas often adds
+    return df.loc[:, ~df.columns.str.contains('^Unnamed')]
+
+def read_csv_head(source: CsvSource, nrows: int) -> pd.DataFrame:
+    """Parses only the first nrows rows."""
+    return _drop_unnamed(pd.read_csv(_open(source), nrows=nrows))
+
+def infer_csv_dtypes(source: CsvSource, sample_rows: int = CSV_SAMPLE_ROWS) -> Dict[str, Any]:
+    """Infers dtypes from the first sample_rows rows for the full parse.
+
+    Text columns become categoricals and float columns float64. Integer columns are left to
+    the parser because later rows may hold missing values.
+    """
+    sample = read_csv_head(source, sample_rows)
+    dtypes: Dict[str, Any] = {}
+    for col in sample.columns:
+        if pd.api.types.is_float_dtype(sample[col]):
+            dtypes[col] = "float64"
+        elif not pd.api.types.is_numeric_dtype(sample[col]) and not pd.api.types.is_bool_dtype(sample[col]):
+            dtypes[col] = "category"
+    return dtypes
+
+def _engine() -> Optional[str]:
+    if CSV_ENGINE == "pyarrow" and importlib.util.find_spec("pyarrow") is None:
+        logger.warning("XAI_CSV_ENGINE=pyarrow but pyarrow is not installed; using the default parser")
+        return None
+    return CSV_ENGINE or None
+
+def load_csv(source: CsvSource, dtypes: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Parses a whole CSV with explicit dtypes, retrying with inference if the sample misled us."""
+    try:
+        return _drop_unnamed(pd.read_csv(_open(source), dtype=dtypes, engine=_engine()))
+    except (ValueError, TypeError) as e:
+        if not dtypes:
+            raise
+        logger.warning(f"CSV did not match dtypes inferred from its first rows ({e}); parsing without them")
+        return _drop_unnamed(pd.read_csv(_open(source), engine=_engine()))
+
+def iter_csv_chunks(source: CsvSource, chunk_size: int):
+    """Reads a CSV as consecutive frames of at most chunk_size rows."""
+    for chunk in pd.read_csv(_open(source), chunksize=chunk_size):
+        yield _drop_unnamed(chunk)
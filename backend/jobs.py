@@ -0,0 +1,239 @@
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from models import TrainRequest, JobStatus
+import services
+import global_explanations
+import ingest
+import metrics
+import model_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRAINING_WORKERS = int(os.getenv("XAI_TRAINING_WORKERS", "2"))
+MAX_FINISHED_JOBS = int(os.getenv("XAI_MAX_FINISHED_JOBS", "200"))
+FINISHED_STATES = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+# Training jobs by id; progress and cancellation flags are shared with workers through a manager
+TRAINING_JOBS: Dict[str, Dict[str, Any]] = {}
+
+_LOCK = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_manager = None
+_dataset_parses = 0  # Pre-parses of uploads queued or running on the training pool
+
+def get_mp_context():
+    """Start method for worker pools; spawn avoids forking a process that already runs threads."""
+    return multiprocessing.get_context(os.getenv("XAI_MP_START_METHOD", "spawn"))
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _manager
+    if _manager is None:
+        _manager = get_mp_context().Manager()
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=TRAINING_WORKERS, mp_context=get_mp_context())
+        logger.info(f"Started training pool with {TRAINING_WORKERS} workers")
+    return _executor
+
+def _run_training_job(csv_path: str, request: TrainRequest, progress, cancel_event, fingerprint: Optional[str] = None) -> Tuple[Dict[str, Any], List]:
+    """Entry point in a worker process: fits and persists the model, reporting progress back to the API process.
+
+    Returns the training response and the timing spans of its stages.
+    """
+    def report(stage: str, fraction: float):
+        progress.update({"stage": stage, "progress": fraction, "status": JobStatus.RUNNING.value})
+    with metrics.collect() as spans:
+        model_data = services.fit_model_service(csv_path, request, progress=report, is_cancelled=cancel_event.is_set, fingerprint=fingerprint)
+        report("saving", 0.95)
+        result = services.persist_trained_model(model_data)
+    return result, spans
+
+def _finish_job(job_id: str, future: Future):
+    """Records a finished job's result, or why it did not complete."""
+    job = TRAINING_JOBS.get(job_id)
+    if job is None:
+        return
+    try:
+        if future.cancelled():
+            job["status"] = JobStatus.CANCELLED
+        else:
+            result, spans = future.result()
+            metrics.record_spans(spans, "/train", job["model_type"])
+            if job["cancel_event"].is_set():
+                model_store.delete_model(result["model_id"])
+                job["status"] = JobStatus.CANCELLED
+            else:
+                if job["training_key"] is not None:
+                    services.remember_trained_model(job["training_key"], result)
+                job["result"] = result
+                job["status"] = JobStatus.COMPLETED
+                job["progress"].update({"stage": "completed", "progress": 1.0})
+                global_explanations.schedule(result["model_id"])
+    except services.TrainingCancelled:
+        job["status"] = JobStatus.CANCELLED
+    except Exception as e:
+        logger.error(f"Training job {job_id} failed: {e}")
+        job["status"] = JobStatus.FAILED
+        job["error"] = str(e)
+    ingest.discard_upload(job["csv_path"])
+    # Finished jobs keep a plain copy of their progress, readable after the manager stops
+    job["progress"] = dict(job["progress"])
+    job["finished_at"] = datetime.now().isoformat()
+    logger.info(f"Training job {job_id} finished with status {job['status'].value}")
+    job["completion"].set_result(_job_view(job))
+    _prune_finished_jobs()
+
+def _prune_finished_jobs():
+    with _LOCK:
+        finished = [job_id for job_id, job in TRAINING_JOBS.items() if job["status"] in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del TRAINING_JOBS[job_id]
+
+def _completed_job(job_id: str, request: TrainRequest, result: Dict[str, Any]) -> Dict[str, Any]:
+    """A job record that is finished from the start, for requests answered by an existing model."""
+    now = datetime.now().isoformat()
+    future = Future()
+    future.set_result(result)
+    job = {
+        "job_id": job_id, "status": JobStatus.COMPLETED, "model_type": request.model_type.value,
+        "target_column": request.target_column, "created_at": now, "finished_at": now,
+        "result": result, "error": None, "future": future, "csv_path": None, "training_key": None,
+        "progress": {"stage": "completed", "progress": 1.0, "status": JobStatus.COMPLETED.value},
+        "cancel_event": threading.Event(), "completion": Future(),
+    }
+    job["completion"].set_result(_job_view(job))
+    return job
+
+def submit_training_job(csv_path: str, request: TrainRequest, fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    """Queues a training run on the worker pool and returns its job record immediately.
+
+    The job takes ownership of the spooled upload at csv_path and removes it when it finishes.
+    With the upload's fingerprint, a model already trained on identical data and settings is
+    returned as a completed job without training again.
+    """
+    global _executor
+    job_id = str(uuid.uuid4())
+    key = services.training_key(fingerprint, request) if fingerprint is not None else None
+    existing = services.find_trained_model(key) if key is not None else None
+    if existing is not None:
+        ingest.discard_upload(csv_path)
+        job = _completed_job(job_id, request, existing)
+        with _LOCK:
+            TRAINING_JOBS[job_id] = job
+        _prune_finished_jobs()
+        return job
+
+    with _LOCK:
+        executor = _get_executor()
+        progress = _manager.dict({"stage": "queued", "progress": 0.0, "status": JobStatus.QUEUED.value})
+        cancel_event = _manager.Event()
+        try:
+            future = executor.submit(_run_training_job, csv_path, request, progress, cancel_event, fingerprint)
+        except BrokenProcessPool:
+            logger.warning("Training pool was broken; starting a new one")
+            _executor = None
+            future = _get_executor().submit(_run_training_job, csv_path, request, progress, cancel_event, fingerprint)
+        job = {
+            "job_id": job_id, "status": JobStatus.QUEUED, "model_type": request.model_type.value,
+            "target_column": request.target_column, "created_at": datetime.now().isoformat(),
+            "finished_at": None, "result": None, "error": None, "future": future, "csv_path": csv_path,
+            "training_key": key, "progress": progress, "cancel_event": cancel_event, "completion": Future(),
+        }
+        TRAINING_JOBS[job_id] = job
+    future.add_done_callback(lambda f: _finish_job(job_id, f))
+    logger.info(f"Queued training job {job_id}: model={request.model_type.value}, target={request.target_column}")
+    return job
+
+def submit_dataset_parse(csv_path: str, fingerprint: str) -> bool:
+    """Parses an upload into the dataset cache on the training pool, at a lower priority than training.
+
+    The parse is only queued while a worker is left over by unfinished training jobs and other
+    pre-parses; otherwise the upload is dropped and /train parses it itself. Takes ownership of
+    the upload at csv_path. Returns whether the parse was queued.
+    """
+    global _executor, _dataset_parses
+    future = None
+    with _LOCK:
+        busy = _dataset_parses + sum(1 for job in TRAINING_JOBS.values() if job["status"] not in FINISHED_STATES)
+        if busy < TRAINING_WORKERS:
+            try:
+                future = _get_executor().submit(services.cache_dataset_service, csv_path, fingerprint)
+                _dataset_parses += 1
+            except BrokenProcessPool:
+                logger.warning("Training pool was broken; skipping the dataset pre-parse")
+                _executor = None
+    if future is None:
+        ingest.discard_upload(csv_path)
+        return False
+    future.add_done_callback(lambda f: _finish_dataset_parse(csv_path))
+    logger.info(f"Queued pre-parse of dataset {fingerprint[:12]}")
+    return True
+
+def _finish_dataset_parse(csv_path: str):
+    global _dataset_parses
+    with _LOCK:
+        _dataset_parses -= 1
+    ingest.discard_upload(csv_path)
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    progress = dict(job["progress"])
+    status = job["status"]
+    if status == JobStatus.QUEUED and progress["status"] == JobStatus.RUNNING.value:
+        status = JobStatus.RUNNING
+    return {
+        "job_id": job["job_id"], "status": status, "stage": progress["stage"], "progress": progress["progress"],
+        "model_type": job["model_type"], "target_column": job["target_column"],
+        "created_at": job["created_at"], "finished_at": job["finished_at"],
+        "result": job["result"], "error": job["error"],
+    }
+
+def get_job(job_id: str) -> Dict[str, Any]:
+    """Returns the current state, stage and progress of a training job."""
+    job = TRAINING_JOBS.get(job_id)
+    if job is None:
+        raise KeyError(f"Training job '{job_id}' not found.")
+    return _job_view(job)
+
+def list_jobs() -> List[Dict[str, Any]]:
+    """Returns all known training jobs, oldest first."""
+    return [_job_view(job) for job in list(TRAINING_JOBS.values())]
+
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    """Cancels one training job: queued jobs never start, running jobs stop at their next stage."""
+    job = TRAINING_JOBS.get(job_id)
+    if job is None:
+        raise KeyError(f"Training job '{job_id}' not found.")
+    if job["status"] in FINISHED_STATES:
+        return _job_view(job)
+    job["cancel_event"].set()
+    if job["future"].cancel():
+        logger.info(f"Training job {job_id} cancelled before it started.")
+    elif job["status"] not in FINISHED_STATES:
+        job["status"] = JobStatus.CANCELLING
+        logger.info(f"Cancellation requested for running training job {job_id}.")
+    return _job_view(job)
+
+def shutdown():
+    """Stops the worker pool, then the progress manager.
+
+    Running jobs are asked to stop at their next stage. The pool is waited for so that the
+    completion callbacks of every job still read their progress before the manager goes away.
+    """
+    global _executor, _manager
+    for job in list(TRAINING_JOBS.values()):
+        if job["status"] not in FINISHED_STATES:
+            job["cancel_event"].set()
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
@@ -1,12 +1,31 @@
 import os
 import sys
+import time
+import asyncio
+import json
 import logging
 import traceback
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from starlette.concurrency import run_in_threadpool
-from models import TrainRequest, ExplainRequest, FeedbackRequest
+import anyio.to_thread
+from models import TrainRequest, ExplainRequest, BatchExplainRequest, PredictRequest, FeedbackRequest, JobStatus
+import pandas as pd
 import services
+import jobs
+import ingest
+import global_explanations
+import batcher
+import explainers
+import explain_workers
+import explanation_store
+import metrics
+import warmup
 import uvicorn
 
 # Add the project root to the Python path
@@ -16,8 +35,17 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy libraries load in the background; /ready reports when explanations can be served
+    warmup.start()
+    yield
+    jobs.shutdown()
+    explain_workers.shutdown()
+    global_explanations.shutdown()
+
 # FastAPI app setup
-app = FastAPI(title="Interactive XAI Platform API", version="1.0.0")
+app = FastAPI(title="Interactive XAI Platform API", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -28,47 +56,247 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    started = time.perf_counter()
+    token = metrics.start_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        server_timing = metrics.finish_request(token, getattr(route, "path", "unmatched"), request.method, status, time.perf_counter() - started)
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
+metrics.register_gauge("xai_cache_entries", "Entries held by each in-memory cache.", lambda: {
+    (("cache", "models"),): len(services.MODELS_CACHE),
+    (("cache", "explanations"),): len(explanation_store.EXPLANATION_CACHE),
+    (("cache", "feedback"),): len(services.FEEDBACK_STATS),
+    (("cache", "explainers"),): len(explainers.EXPLAINER_CACHE),
+    (("cache", "global_explanations"),): len(global_explanations.GLOBAL_EXPLANATION_CACHE),
+})
+metrics.register_gauge("xai_explanation_cache_bytes", "Serialized size of the stored explanations.", explanation_store.stored_bytes)
+metrics.register_gauge("xai_explanation_cache_events_total", "Explanation store lookups and removals by outcome.", lambda: {
+    (("event", event),): count for event, count in explanation_store.STATS.items()
+}, metric_type="counter")
+metrics.register_gauge("xai_feedback_entries", "Feedback entries aggregated across loaded models.", lambda: sum(stats["count"] for stats in list(services.FEEDBACK_STATS.values())))
+metrics.register_gauge("xai_resident_model_bytes", "On-disk size of the models resident in memory.", lambda: sum(data.get("stored_bytes") or 0 for data in list(services.MODELS_CACHE.values())))
+metrics.register_gauge("xai_ready", "1 once startup and warm-up have finished.", lambda: int(warmup.is_ready()))
+metrics.register_gauge("xai_training_jobs", "Training jobs by status.", lambda: {
+    (("status", status.value),): sum(1 for job in jobs.list_jobs() if job["status"] == status) for status in JobStatus
+})
+metrics.register_gauge("xai_predict_pending_rows", "Rows waiting in the prediction micro-batcher.", batcher.pending_rows)
+metrics.register_gauge("xai_global_explanations_pending", "Global explanations being computed.", lambda: len(global_explanations.PENDING))
+
 # Routes
 @app.post("/inspect-csv")
-async def inspect_csv_endpoint(file: UploadFile = File(...)):
+async def inspect_csv_endpoint(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    csv_path = None
     try:
         logger.info(f"Inspecting file: {file.filename}")
-        contents = await file.read()
-        return await run_in_threadpool(services.inspect_csv_service, contents)
+        csv_path, fingerprint = await ingest.spool_upload(file)
+        result = await run_in_threadpool(services.inspect_csv_service, csv_path)
+        # After responding, an idle training worker parses the whole file for the /train that usually follows
+        background_tasks.add_task(jobs.submit_dataset_parse, csv_path, fingerprint)
+        csv_path = None
+        return {**result, "fingerprint": fingerprint}
     except Exception as e:
         logger.error(f"Error during CSV inspection: {e}", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        ingest.discard_upload(csv_path)
 
 @app.post("/train")
 async def train_model_endpoint(
     file: UploadFile = File(...),
     model_type: str = Form(...),
     target_column: str = Form(...),
+    background: bool = Form(False),
+    tune: bool = Form(False),
+    search_strategy: str = Form("halving"),
+    n_candidates: int = Form(20),
+    cv_folds: int = Form(3),
+    time_budget_seconds: Optional[float] = Form(None),
+    categorical_encoding: str = Form("auto"),
 ):
     try:
-        logger.info(f"Training request: model={model_type}, target={target_column}")
-        contents = await file.read()
-        train_request = TrainRequest(model_type=model_type, target_column=target_column)
-        result = await run_in_threadpool(services.train_model_service, contents, train_request)
+        logger.info(f"Training request: model={model_type}, target={target_column}, tune={tune}")
+        train_request = TrainRequest(
+            model_type=model_type, target_column=target_column, tune=tune, search_strategy=search_strategy,
+            n_candidates=n_candidates, cv_folds=cv_folds, time_budget_seconds=time_budget_seconds,
+            categorical_encoding=categorical_encoding,
+        )
+        csv_path, fingerprint = await ingest.spool_upload(file)
+        try:
+            # Starting the pool or loading an already trained model blocks, so keep it off the event loop
+            job = await run_in_threadpool(jobs.submit_training_job, csv_path, train_request, fingerprint)
+        except Exception:
+            # The job only owns the upload once it is queued
+            ingest.discard_upload(csv_path)
+            raise
+        if background:
+            return JSONResponse(status_code=202, content=jsonable_encoder(jobs.get_job(job["job_id"])))
+        finished = await asyncio.wrap_future(job["completion"])
+        if finished["status"] != JobStatus.COMPLETED:
+            raise RuntimeError(finished["error"] or f"Training job {finished['status'].value}.")
+        result = finished["result"]
         logger.info(f"Training successful. Model ID: {result['model_id']}")
-        return result
+        return {**result, "job_id": job["job_id"]}
     except Exception as e:
         logger.error(f"Error during model training: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
 
+@app.get("/jobs")
+def list_jobs_endpoint():
+    return jobs.list_jobs()
+
+@app.get("/jobs/{job_id}")
+def get_job_endpoint(job_id: str):
+    try:
+        return jobs.get_job(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job_endpoint(job_id: str):
+    try:
+        return jobs.cancel_job(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
 @app.post("/explain")
 async def explain_model_endpoint(request: ExplainRequest):
     try:
         logger.info(f"Explanation request for model ID: {request.model_id}")
         logger.info(f"Data point: {request.data_point}")
-        explanations = await run_in_threadpool(services.explain_model_service, request)
+        explanations = await run_in_threadpool(explain_workers.explain, request)
         logger.info("Explanation generation successful.")
         return explanations
+    except TimeoutError as e:
+        logger.warning(f"Explanation for model {request.model_id} timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error during explanation: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
+@app.get("/explanations/{explanation_id}")
+async def get_explanation_endpoint(explanation_id: str):
+    try:
+        return await run_in_threadpool(services.get_explanation_service, explanation_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+def ndjson_stream(events):
+    """Serializes (kind, payload) explanation events as newline-delimited JSON."""
+    try:
+        for kind, payload in events:
+            yield json.dumps({"type": kind, **payload}) + "\n"
+    except Exception as e:
+        logger.error(f"Error while streaming explanations: {e}", exc_info=True)
+        yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+@app.post("/explain/batch")
+async def explain_batch_endpoint(request: BatchExplainRequest):
+    try:
+        logger.info(f"Batch explanation request for model ID: {request.model_id} ({len(request.data_points)} rows)")
+        data = pd.DataFrame(request.data_points)
+        if request.stream:
+            events = await run_in_threadpool(services.iter_batch_explanations, request.model_id, services.chunk_frame(data), request.top_k, request.include_lime)
+            return StreamingResponse(ndjson_stream(events), media_type="application/x-ndjson")
+        return await run_in_threadpool(services.explain_batch_service, request.model_id, data, request.top_k, request.include_lime)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during batch explanation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch explanation failed: {str(e)}")
+
+@app.post("/explain/batch/csv")
+async def explain_batch_csv_endpoint(
+    file: UploadFile = File(...),
+    model_id: str = Form(...),
+    top_k: Optional[int] = Form(None),
+    include_lime: bool = Form(True),
+    stream: bool = Form(False),
+):
+    csv_path = None
+    try:
+        logger.info(f"Batch CSV explanation request for model ID: {model_id}, file: {file.filename}")
+        csv_path, _ = await ingest.spool_upload(file)
+        if stream:
+            chunks = ingest.iter_csv_chunks(csv_path, services.BATCH_CHUNK_SIZE)
+            events = await run_in_threadpool(services.iter_batch_explanations, model_id, chunks, top_k, include_lime)
+            # The stream removes the upload once the last chunk has been sent
+            response = StreamingResponse(ndjson_stream(events), media_type="application/x-ndjson", background=BackgroundTask(ingest.discard_upload, csv_path))
+            csv_path = None
+            return response
+        data = await run_in_threadpool(ingest.load_csv, csv_path)
+        return await run_in_threadpool(services.explain_batch_service, model_id, data, top_k, include_lime)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during batch explanation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch explanation failed: {str(e)}")
+    finally:
+        ingest.discard_upload(csv_path)
+
+@app.post("/models/{model_id}/predict")
+async def predict_endpoint(model_id: str, request: PredictRequest):
+    if (request.data_point is None) == (request.data_points is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of data_point or data_points.")
+    try:
+        if await run_in_threadpool(services.get_model_data, model_id) is None:
+            raise HTTPException(status_code=404, detail="Model not found. Please train the model first.")
+        if request.data_point is not None:
+            return {"model_id": model_id, **await batcher.predict(model_id, request.data_point)}
+        predictions = await run_in_threadpool(services.predict_service, model_id, pd.DataFrame(request.data_points))
+        return {"model_id": model_id, "predictions": predictions}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during prediction: {e}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Prediction failed: {str(e)}")
+
+@app.get("/models/memory")
+def memory_report_endpoint():
+    return services.memory_report_service()
+
+@app.get("/models/{model_id}/memory")
+def model_memory_report_endpoint(model_id: str):
+    try:
+        return services.memory_report_service(model_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/models/{model_id}/global-explanation")
+async def global_explanation_endpoint(model_id: str, split: str = "train", sample_size: int = global_explanations.GLOBAL_SAMPLE_SIZE, wait: bool = False):
+    try:
+        result = await run_in_threadpool(global_explanations.get_global_explanation, model_id, split, sample_size, wait)
+        if result is None:
+            return JSONResponse(status_code=202, content={"model_id": model_id, "split": split, "sample_size": min(sample_size, global_explanations.GLOBAL_SAMPLE_SIZE), "status": "pending"})
+        return result
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during global explanation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Global explanation failed: {str(e)}")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # The default threadpool that runs the sync services; tasks_waiting is its queue depth
+    limiter = anyio.to_thread.current_default_thread_limiter().statistics()
+    threadpool = {
+        "xai_threadpool_threads_busy": ("Threadpool threads running service calls.", limiter.borrowed_tokens),
+        "xai_threadpool_threads_total": ("Threadpool size.", limiter.total_tokens),
+        "xai_threadpool_queue_depth": ("Service calls waiting for a threadpool thread.", limiter.tasks_waiting),
+    }
+    return PlainTextResponse(metrics.render(threadpool), media_type="text/plain; version=0.0.4")
+
 @app.post("/feedback")
 async def feedback_endpoint(request: FeedbackRequest):
     try:
@@ -80,6 +308,15 @@ async def feedback_endpoint(request: FeedbackRequest):
         logger.error(f"Error processing feedback: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not process feedback: {e}")
 
+@app.get("/health")
+def health_endpoint():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_endpoint():
+    state = warmup.readiness()
+    return JSONResponse(status_code=200 if warmup.is_ready() else 503, content=state)
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Interactive XAI Platform API"}
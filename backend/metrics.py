@@ -0,0 +1,149 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+# Latency buckets in seconds, from sub-millisecond lookups to multi-minute training runs
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SERVER_TIMING = os.getenv("XAI_SERVER_TIMING", "0") == "1"  # Add a Server-Timing header to every response
+
+STAGE_METRIC = "xai_stage_duration_seconds"
+REQUEST_METRIC = "xai_request_duration_seconds"
+_HELP = {
+    STAGE_METRIC: "Time spent in one stage of training, explanation or prediction.",
+    REQUEST_METRIC: "Time spent handling an HTTP request.",
+}
+
+# (metric, sorted label pairs) -> [per-bucket counts, sum, count]
+_HISTOGRAMS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]] = {}
+# name -> (help, callable returning a value or {labels tuple: value}, "gauge" or "counter")
+_GAUGES: Dict[str, Tuple[str, Callable[[], Any], str]] = {}
+_LOCK = threading.Lock()
+
+# The request being handled: endpoint and model_type labels plus the spans recorded so far
+_REQUEST: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("xai_request", default=None)
+
+def observe(metric: str, seconds: float, **labels):
+    """Adds one observation to a histogram."""
+    key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _LOCK:
+        entry = _HISTOGRAMS.get(key)
+        if entry is None:
+            entry = _HISTOGRAMS[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += seconds
+        entry[2] += 1
+
+def set_model_type(model_type: str):
+    """Labels the spans of the current request with the model type they worked on."""
+    request = _REQUEST.get()
+    if request is not None:
+        request["model_type"] = model_type
+
+def record_span(stage: str, seconds: float, model_type: Optional[str] = None):
+    """Records a finished stage for the current request, or straight away outside of one."""
+    request = _REQUEST.get()
+    if request is None:
+        observe(STAGE_METRIC, seconds, stage=stage, endpoint="background", model_type=model_type or "")
+        return
+    with _LOCK:
+        if not request["closed"]:
+            request["spans"].append((stage, seconds, model_type))
+            return
+    # Work still running after the response started, e.g. a streamed body
+    observe(STAGE_METRIC, seconds, stage=stage, endpoint=request["endpoint"], model_type=model_type or request["model_type"])
+
+@contextmanager
+def span(stage: str):
+    """Times a named stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+@contextmanager
+def collect():
+    """Collects spans into a list instead of the histograms, e.g. in a worker process.
+
+    The caller hands the list to the API process, which records it with record_spans.
+    """
+    spans: List[Tuple[str, float, Optional[str]]] = []
+    token = _REQUEST.set({"endpoint": "background", "model_type": "", "spans": spans, "closed": False})
+    try:
+        yield spans
+    finally:
+        _REQUEST.reset(token)
+
+def record_spans(spans: List[Tuple[str, float, Optional[str]]], endpoint: str, model_type: str = ""):
+    """Adds spans gathered by collect() to the stage histograms."""
+    for stage, seconds, span_model_type in spans:
+        observe(STAGE_METRIC, seconds, stage=stage, endpoint=endpoint, model_type=span_model_type or model_type)
+
+def start_request() -> contextvars.Token:
+    return _REQUEST.set({"endpoint": "", "model_type": "", "spans": [], "closed": False})
+
+def finish_request(token: contextvars.Token, endpoint: str, method: str, status: int, seconds: float) -> Optional[str]:
+    """Moves a request's spans into the histograms and returns its Server-Timing header value, if enabled."""
+    request = _REQUEST.get()
+    _REQUEST.reset(token)
+    with _LOCK:
+        request["endpoint"] = endpoint
+        request["closed"] = True
+        spans = list(request["spans"])
+    record_spans(spans, endpoint, request["model_type"])
+    observe(REQUEST_METRIC, seconds, endpoint=endpoint, method=method, status=status)
+    if not SERVER_TIMING:
+        return None
+    totals: Dict[str, float] = {}
+    for stage, duration, _ in spans:
+        totals[stage] = totals.get(stage, 0.0) + duration
+    entries = [f"{stage};dur={duration * 1000:.2f}" for stage, duration in totals.items()]
+    return ", ".join(entries + [f"total;dur={seconds * 1000:.2f}"])
+
+def register_gauge(name: str, help_text: str, fn: Callable[[], Any], metric_type: str = "gauge"):
+    """Registers a value read at scrape time; fn returns a number or a {labels tuple: number} dict.
+
+    Use metric_type="counter" for monotonically increasing totals kept elsewhere.
+    """
+    _GAUGES[name] = (help_text, fn, metric_type)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def render(extra_gauges: Optional[Dict[str, Tuple[str, Any]]] = None) -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _LOCK:
+        histograms = sorted((key, (list(v[0]), v[1], v[2])) for key, v in _HISTOGRAMS.items())
+    current = None
+    for (metric, pairs), (counts, total, count) in histograms:
+        if metric != current:
+            lines += [f"# HELP {metric} {_HELP.get(metric, metric)}", f"# TYPE {metric} histogram"]
+            current = metric
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f"{metric}_bucket{_labels(pairs + (('le', repr(bound)),))} {cumulative}")
+        lines.append(f"{metric}_bucket{_labels(pairs + (('le', '+Inf'),))} {count}")
+        lines.append(f"{metric}_sum{_labels(pairs)} {total}")
+        lines.append(f"{metric}_count{_labels(pairs)} {count}")
+
+    gauges = {name: (help_text, fn(), metric_type) for name, (help_text, fn, metric_type) in _GAUGES.items()}
+    gauges.update({name: (help_text, value, "gauge") for name, (help_text, value) in (extra_gauges or {}).items()})
+    for name, (help_text, value, metric_type) in sorted(gauges.items()):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        values = value if isinstance(value, dict) else {(): value}
+        for pairs, v in values.items():
+            lines.append(f"{name}{_labels(pairs)} {v}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: artifact updates are only serialized within one process
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MODEL_STORE_DIR = os.getenv("XAI_MODEL_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_store"))
+# Parsed datasets by content fingerprint; the leading dot keeps them out of list_models
+DATASET_STORE_DIR = os.getenv("XAI_DATASET_STORE_DIR", os.path.join(MODEL_STORE_DIR, ".datasets"))
+MAX_STORED_DATASETS = int(os.getenv("XAI_DATASET_CACHE_SIZE", "16"))
+# Training key -> model id, shared by every worker and kept across restarts
+TRAINING_KEY_DIR = os.path.join(MODEL_STORE_DIR, ".training_keys")
+
+# Model entries persisted as frames or arrays; everything else except the pipeline goes into meta.joblib
+FRAME_KEYS = ["data"]
+ARRAY_KEYS = ["train_idx", "test_idx"]
+# Entries rebuilt from the pipeline on load
+TRANSIENT_KEYS = ["pipeline", "preprocessor", "model"]
+
+def set_store_dir(path: str):
+    """Points the store, datasets and training keys included, at another directory.
+
+    Worker processes started afterwards inherit it through the environment.
+    """
+    global MODEL_STORE_DIR, DATASET_STORE_DIR, TRAINING_KEY_DIR
+    MODEL_STORE_DIR = path
+    DATASET_STORE_DIR = os.path.join(path, ".datasets")
+    TRAINING_KEY_DIR = os.path.join(path, ".training_keys")
+    os.environ["XAI_MODEL_STORE_DIR"] = MODEL_STORE_DIR
+    os.environ["XAI_DATASET_STORE_DIR"] = DATASET_STORE_DIR
+
+def _model_dir(model_id: str) -> str:
+    return os.path.join(MODEL_STORE_DIR, os.path.basename(model_id))
+
+def _is_mappable(dtype) -> bool:
+    """Plain NumPy dtypes that np.load can memory-map."""
+    return isinstance(dtype, np.dtype) and dtype.kind in "biufcmM"
+
+def _save_frame(path: str, data) -> Dict[str, Any]:
+    """Writes a DataFrame or Series as one .npy file per column and returns its schema.
+
+    Numeric columns keep their dtype; all other columns are stored as categorical codes,
+    so every file can be opened with mmap_mode='r'.
+    """
+    is_series = isinstance(data, pd.Series)
+    frame = data.to_frame() if is_series else data
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for i, col in enumerate(frame.columns):
+        values = frame.iloc[:, i]
+        if _is_mappable(values.dtype):
+            np.save(os.path.join(path, f"{i}.npy"), values.to_numpy())
+            columns.append({"name": col, "kind": "array"})
+        else:
+            categorical = pd.Categorical(values)
+            np.save(os.path.join(path, f"{i}.npy"), categorical.codes)
+            columns.append({"name": col, "kind": "categorical", "categories": categorical.categories, "ordered": categorical.ordered})
+    schema = {"columns": columns, "series": is_series, "name": data.name if is_series else None}
+    if _is_mappable(frame.index.dtype):
+        np.save(os.path.join(path, "index.npy"), frame.index.to_numpy())
+    else:
+        schema["index"] = frame.index
+    return schema
+
+def _load_frame(path: str, schema: Dict[str, Any]):
+    """Opens a frame written by _save_frame with every column memory-mapped.
+
+    Categorical columns wrap the mapped codes as they are; _save_frame wrote them, so they
+    are neither validated, which would read every page, nor copied.
+    """
+    columns = {}
+    for i, column in enumerate(schema["columns"]):
+        values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode='r')
+        if column["kind"] == "categorical":
+            dtype = pd.CategoricalDtype(column["categories"], ordered=column["ordered"])
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        columns[column["name"]] = values
+    index = schema["index"] if "index" in schema else pd.Index(np.load(os.path.join(path, "index.npy"), mmap_mode='r'))
+    frame = pd.DataFrame(columns, index=index, copy=False)
+    if schema["series"]:
+        return frame.iloc[:, 0].rename(schema["name"])
+    return frame
+
+def save_model(model_id: str, model_data: Dict[str, Any]):
+    """Persists a trained model: the pipeline with joblib, the training snapshot as .npy columns."""
+    os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{model_id}.", dir=MODEL_STORE_DIR)
+    try:
+        joblib.dump(model_data["pipeline"], os.path.join(staging, "pipeline.joblib"))
+        meta = {key: value for key, value in model_data.items() if key not in FRAME_KEYS + ARRAY_KEYS + TRANSIENT_KEYS}
+        meta["frames"] = {key: _save_frame(os.path.join(staging, key), model_data[key]) for key in FRAME_KEYS if key in model_data}
+        for key in ARRAY_KEYS:
+            np.save(os.path.join(staging, f"{key}.npy"), np.asarray(model_data[key]))
+        joblib.dump(meta, os.path.join(staging, "meta.joblib"))
+        target = _model_dir(model_id)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        # Readers only ever see a complete model directory
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"Model {model_id} persisted to {MODEL_STORE_DIR}")
+
+def load_model(model_id: str) -> Optional[Dict[str, Any]]:
+    """Loads a persisted model with its training frames memory-mapped, or None if it isn't stored."""
+    path = _model_dir(model_id)
+    if not os.path.isfile(os.path.join(path, "meta.joblib")):
+        return None
+    meta = joblib.load(os.path.join(path, "meta.joblib"))
+    pipeline = joblib.load(os.path.join(path, "pipeline.joblib"))
+    model_data = {key: value for key, value in meta.items() if key != "frames"}
+    for key, schema in meta["frames"].items():
+        model_data[key] = _load_frame(os.path.join(path, key), schema)
+    for key in ARRAY_KEYS:
+        model_data[key] = np.load(os.path.join(path, f"{key}.npy"), mmap_mode='r')
+    model_data.update({
+        "pipeline": pipeline, "preprocessor": pipeline.named_steps['preprocessor'], "model": pipeline.named_steps['classifier'],
+        "stored_bytes": stored_bytes(model_id),
+    })
+    return model_data
+
+def save_artifact(model_id: str, name: str, value: Any):
+    """Stores a derived result (such as a global explanation) alongside a persisted model."""
+    path = _model_dir(model_id)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Model {model_id} is not in the store")
+    fd, staging = tempfile.mkstemp(prefix=f".{name}.", dir=path)
+    os.close(fd)
+    try:
+        joblib.dump(value, staging)
+        os.replace(staging, os.path.join(path, f"{name}.joblib"))
+    except Exception:
+        os.remove(staging)
+        raise
+
+_ARTIFACT_LOCK = threading.Lock()
+
+@contextmanager
+def artifact_lock(model_id: str, name: str):
+    """Serializes read-modify-write updates of one artifact across threads and worker processes."""
+    path = _model_dir(model_id)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Model {model_id} is not in the store")
+    with _ARTIFACT_LOCK, open(os.path.join(path, f".{name}.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_artifact(model_id: str, name: str) -> Optional[Any]:
+    """Loads a result stored with save_artifact, or None if there is none."""
+    try:
+        return joblib.load(os.path.join(_model_dir(model_id), f"{name}.joblib"))
+    except FileNotFoundError:
+        return None
+
+def training_split(model_data: Dict[str, Any], split: str = "train") -> Tuple[pd.DataFrame, pd.Series]:
+    """Features and target of the train or test rows of a model's training snapshot."""
+    rows = model_data["data"].iloc[model_data[f"{split}_idx"]]
+    target_column = model_data["target_column"]
+    return rows.drop(columns=[target_column]), rows[target_column]
+
+def stored_bytes(model_id: str) -> int:
+    """Size of a model's artifacts on disk."""
+    total = 0
+    for root, _, files in os.walk(_model_dir(model_id)):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def delete_model(model_id: str):
+    """Removes a model's artifacts from the store."""
+    shutil.rmtree(_model_dir(model_id), ignore_errors=True)
+
+def list_models(newest_first: bool = False) -> List[str]:
+    """Ids of all models in the store, optionally most recently saved first."""
+    if not os.path.isdir(MODEL_STORE_DIR):
+        return []
+    model_ids = [name for name in os.listdir(MODEL_STORE_DIR) if not name.startswith(".") and os.path.isfile(os.path.join(MODEL_STORE_DIR, name, "meta.joblib"))]
+    if newest_first:
+        model_ids.sort(key=lambda name: os.path.getmtime(os.path.join(MODEL_STORE_DIR, name, "meta.joblib")), reverse=True)
+    return model_ids
+
+def _training_key_path(key: str) -> str:
+    return os.path.join(TRAINING_KEY_DIR, hashlib.sha256(key.encode()).hexdigest())
+
+def save_training_key(key: str, model_id: str):
+    """Records the model a training key produced."""
+    os.makedirs(TRAINING_KEY_DIR, exist_ok=True)
+    fd, staging = tempfile.mkstemp(prefix=".key.", dir=TRAINING_KEY_DIR)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(model_id)
+        os.replace(staging, _training_key_path(key))
+    except Exception:
+        os.remove(staging)
+        raise
+
+def find_training_key(key: str) -> Optional[str]:
+    """The model id recorded for a training key, or None."""
+    try:
+        with open(_training_key_path(key)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def forget_training_key(key: str):
+    """Drops a training key, e.g. once its model is gone."""
+    try:
+        os.remove(_training_key_path(key))
+    except FileNotFoundError:
+        pass
+
+def _dataset_dir(fingerprint: str) -> str:
+    return os.path.join(DATASET_STORE_DIR, os.path.basename(fingerprint))
+
+def save_dataset(fingerprint: str, df: pd.DataFrame):
+    """Stores a parsed dataset under its content fingerprint, dropping the oldest ones over MAX_STORED_DATASETS."""
+    os.makedirs(DATASET_STORE_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{fingerprint}.", dir=DATASET_STORE_DIR)
+    try:
+        schema = _save_frame(os.path.join(staging, "frame"), df)
+        joblib.dump(schema, os.path.join(staging, "schema.joblib"))
+        target = _dataset_dir(fingerprint)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    stored = sorted((entry for entry in os.scandir(DATASET_STORE_DIR) if entry.is_dir() and not entry.name.startswith(".")), key=lambda entry: entry.stat().st_mtime)
+    for entry in stored[:max(0, len(stored) - MAX_STORED_DATASETS)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    logger.info(f"Dataset {fingerprint[:12]} stored in {DATASET_STORE_DIR}")
+
+def load_dataset(fingerprint: str) -> Optional[pd.DataFrame]:
+    """Opens a stored dataset memory-mapped, or returns None if it isn't stored."""
+    path = _dataset_dir(fingerprint)
+    try:
+        schema = joblib.load(os.path.join(path, "schema.joblib"))
+        df = _load_frame(os.path.join(path, "frame"), schema)
+    except FileNotFoundError:
+        return None
+    # Mark it recently used so pruning drops other datasets first
+    os.utime(path)
+    return df
@@ -9,17 +9,42 @@ class ModelType(str, Enum):
     svm = "svm"
     linear_regression = "linear_regression"
 
+class SearchStrategy(str, Enum):
+    halving = "halving"
+    random = "random"
+
+class CategoricalEncoding(str, Enum):
+    auto = "auto"  # Dense one-hot unless a column has more than XAI_DENSE_ONEHOT_MAX_LEVELS levels
+    onehot = "onehot"
+    sparse = "sparse"
+
 class ProblemType(str, Enum):
     CLASSIFICATION = "classification"
     REGRESSION = "regression"
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    CANCELLING = "cancelling"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class InspectResponse(BaseModel):
     columns: List[str]
     sample_data: List[Dict[str, Any]]
+    dtypes: Optional[Dict[str, str]] = None
+    fingerprint: Optional[str] = None
 
 class TrainRequest(BaseModel):
     model_type: ModelType
     target_column: str
+    tune: bool = False  # Cross-validated hyperparameter search instead of the fixed configuration
+    search_strategy: SearchStrategy = SearchStrategy.halving
+    n_candidates: int = Field(20, ge=1, le=500)
+    cv_folds: int = Field(3, ge=2, le=10)
+    time_budget_seconds: Optional[float] = Field(None, gt=0)  # Stop the search, not the final fit, after this
+    categorical_encoding: CategoricalEncoding = CategoricalEncoding.auto
 
 class TrainResponse(BaseModel):
     model_id: str
@@ -29,10 +54,40 @@ class TrainResponse(BaseModel):
     target_column: str
     numeric_columns: List[str]
     sample_data: List[Dict[str, Any]]
+    test_metrics: Optional[Dict[str, float]] = None
+    tuning: Optional[Dict[str, Any]] = None
+    preprocessing: Optional[Dict[str, Any]] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    stage: Optional[str] = None
+    progress: float
+    model_type: ModelType
+    target_column: str
+    created_at: str
+    finished_at: Optional[str] = None
+    result: Optional[TrainResponse] = None
+    error: Optional[str] = None
 
 class ExplainRequest(BaseModel):
     model_id: str
     data_point: Dict[str, Any]
+    timeout_seconds: Optional[float] = Field(None, gt=0)  # Deadline on the worker pool; defaults to XAI_EXPLAIN_TIMEOUT_SECONDS
+    # Either one switches KernelExplainer to adaptive sampling, which reports the variance reached
+    shap_tolerance: Optional[float] = Field(None, gt=0)  # Max standard error of any attribution; defaults to XAI_SHAP_TOLERANCE
+    latency_budget_ms: Optional[float] = Field(None, gt=0)  # Stop sampling before exceeding this
+
+class BatchExplainRequest(BaseModel):
+    model_id: str
+    data_points: List[Dict[str, Any]]
+    top_k: Optional[int] = Field(None, ge=1)
+    include_lime: bool = True
+    stream: bool = False  # Stream newline-delimited JSON instead of one response body
+
+class PredictRequest(BaseModel):
+    data_point: Optional[Dict[str, Any]] = None  # One row, micro-batched with concurrent requests
+    data_points: Optional[List[Dict[str, Any]]] = None  # Several rows, predicted in one call
 
 class ShapExplanation(BaseModel):
     features: List[str]
@@ -50,6 +105,17 @@ class ExplainResponse(BaseModel):
     lime: LimeExplanation
     overall_reliability: Optional[float] = None
 
+class BatchRowExplanation(BaseModel):
+    row: int
+    shap: Dict[str, List[Any]]
+    lime: Optional[Dict[str, float]] = None
+
+class BatchExplainResponse(BaseModel):
+    model_id: str
+    rows: List[BatchRowExplanation]
+    aggregate: Dict[str, Any]
+    parameters_used: Dict[str, Any]
+
 class FeedbackRequest(BaseModel):
     model_id: str
     explanation_id: Optional[str] = None
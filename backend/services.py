@@ -1,40 +1,59 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, LabelEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.impute import SimpleImputer
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
-from sklearn.linear_model import LogisticRegression, LinearRegression
-from sklearn.svm import SVC, SVR
 import uuid
 import os
-import shap
-import lime
-import lime.lime_tabular
 import logging
-from typing import Dict, Any, List
-import io
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Iterator, Callable
 import warnings
 import json
 from datetime import datetime
 import re
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
 
 warnings.filterwarnings('ignore')
 
 from models import TrainRequest, ExplainRequest, FeedbackRequest
+import explainers
+import explanation_store
+import feedback
+import ingest
+import metrics
+import model_store
+import tuning
 
 # Configure logging
 logger = logging.getLogger(__name__)
-
-# In-memory storage for models and data
-MODELS_CACHE: Dict[str, Dict[str, Any]] = {}
-FEEDBACK_CACHE: Dict[str, List[Dict[str, Any]]] = {}  # Store feedback per model
-EXPLANATION_CACHE: Dict[str, Dict[str, Any]] = {}  # Store explanations with IDs
-TRAINING_CANCELLED = False # Flag for training cancellation
+_MODELS_LOCK = threading.Lock()
+
+# Resident models in LRU order; everything is also persisted in model_store
+MODELS_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+MAX_RESIDENT_MODELS = int(os.getenv("XAI_MODEL_CACHE_SIZE", "32"))
+MAX_RESIDENT_BYTES = int(os.getenv("XAI_MODEL_CACHE_BYTES", str(2 * 1024 ** 3)))
+FEEDBACK_STATS: Dict[str, Dict[str, Any]] = {}  # Running feedback aggregates per model, persisted with the model
+_FEEDBACK_LOCK = threading.Lock()
+TRAINED_MODEL_INDEX: "OrderedDict[str, str]" = OrderedDict()  # training_key -> model_id; the store keeps the full index
+MAX_TRAINED_MODEL_INDEX = int(os.getenv("XAI_TRAINED_MODEL_INDEX_SIZE", "1024"))
+BATCH_CHUNK_SIZE = int(os.getenv("XAI_BATCH_CHUNK_SIZE", "256"))  # Rows explained per batched pass
+
+# Adaptive KernelExplainer sampling: independent estimates averaged until they agree
+SHAP_TOLERANCE = float(os.getenv("XAI_SHAP_TOLERANCE", "0.01"))  # Default max standard error of any attribution
+SHAP_CHUNK_SAMPLES = int(os.getenv("XAI_SHAP_CHUNK_SAMPLES", "128"))  # Coalitions per independent estimate
+SHAP_PARALLEL_CHUNKS = int(os.getenv("XAI_SHAP_PARALLEL_CHUNKS", str(min(4, os.cpu_count() or 1))))
+SHAP_MIN_CHUNKS = int(os.getenv("XAI_SHAP_MIN_CHUNKS", "4"))  # Estimates before the standard error is trusted
+SHAP_MAX_CHUNKS = int(os.getenv("XAI_SHAP_MAX_CHUNKS", "32"))
+# Threads overlap only while the model's predict releases the GIL, which is most of a chunk for costly models
+_SHAP_POOL = ThreadPoolExecutor(max_workers=max(2, SHAP_PARALLEL_CHUNKS), thread_name_prefix="kernel-shap")
+
+# Categorical encoding: dense one-hot for small vocabularies, sparse and grouped beyond them
+DENSE_ONEHOT_MAX_LEVELS = int(os.getenv("XAI_DENSE_ONEHOT_MAX_LEVELS", "50"))  # "auto" goes sparse past this many levels in a column
+MIN_CATEGORY_FREQUENCY = int(os.getenv("XAI_MIN_CATEGORY_FREQUENCY", "5"))  # Rarer categories share one infrequent column
+MAX_ONEHOT_CATEGORIES = int(os.getenv("XAI_MAX_ONEHOT_CATEGORIES", "100"))  # One-hot columns per input column, infrequent included
+HIGH_CARDINALITY = int(os.getenv("XAI_HIGH_CARDINALITY", "1000"))  # Columns with more levels are ordinal or target encoded
 
 def safe_float_conversion(value):
     """Safely convert value to float, handling arrays and edge cases."""
@@ -53,26 +72,18 @@ def safe_float_conversion(value):
     except (ValueError, TypeError, AttributeError):
         return 0.0
 
+def get_feedback_stats(model_id: str) -> Dict[str, Any]:
+    """The model's running feedback aggregates, restored from the model store on first use."""
+    stats = FEEDBACK_STATS.get(model_id)
+    if stats is None:
+        stats = model_store.load_artifact(model_id, "feedback_stats") or feedback.new_stats()
+        with _FEEDBACK_LOCK:
+            stats = FEEDBACK_STATS.setdefault(model_id, stats)
+    return stats
+
 def calculate_reliability_score(model_id: str, explanation_type: str = "both") -> float:
     """Calculate reliability score based on feedback history."""
-    if model_id not in FEEDBACK_CACHE:
-        return 0.5
-    feedbacks = FEEDBACK_CACHE[model_id]
-    if not feedbacks:
-        return 0.5
-    if explanation_type != "both":
-        feedbacks = [f for f in feedbacks if f.get('explanation_type', 'both') == explanation_type]
-    if not feedbacks:
-        return 0.5
-    total_weight = 0
-    weighted_sum = 0
-    for i, feedback in enumerate(reversed(feedbacks[-10:])):
-        weight = (i + 1) / 10
-        rating = feedback['rating']
-        normalized_rating = (rating - 1) / 4
-        weighted_sum += normalized_rating * weight
-        total_weight += weight
-    return weighted_sum / total_weight if total_weight > 0 else 0.5
+    return feedback.reliability_score(get_feedback_stats(model_id), explanation_type)
 
 def adjust_explanation_parameters(model_id: str, avg_rating: float) -> Dict[str, Any]:
     """Adjust explanation parameters based on average rating."""
@@ -89,7 +100,7 @@ def adjust_explanation_parameters(model_id: str, avg_rating: float) -> Dict[str,
         })
     return params
 
-def get_improvement_suggestions(avg_rating: float, feedback_comments: List[str]) -> List[str]:
+def get_improvement_suggestions(avg_rating: float, keyword_counts: Dict[str, int]) -> List[str]:
     """Generate improvement suggestions based on rating and comments."""
     suggestions = []
     if avg_rating < 2.0:
@@ -104,15 +115,19 @@ def get_improvement_suggestions(avg_rating: float, feedback_comments: List[str])
         ])
     else:
         suggestions.append("Great! The current explanation approach works well for your data")
-    comment_text = " ".join(feedback_comments).lower()
-    if "confusing" in comment_text or "unclear" in comment_text:
+    if keyword_counts.get("confusing") or keyword_counts.get("unclear"):
         suggestions.append("Explanation clarity has been prioritized in the updated parameters")
-    if "slow" in comment_text or "time" in comment_text:
+    if keyword_counts.get("slow") or keyword_counts.get("time"):
         suggestions.append("Explanation speed has been optimized")
     return suggestions[:3]
 
 def get_model_instance(model_type: str, problem_type: str):
     """Returns a model instance based on type and problem with efficiency optimizations."""
+    # scikit-learn is imported on first use so that starting the API stays fast
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+    from sklearn.linear_model import LogisticRegression, LinearRegression
+    from sklearn.svm import SVC, SVR
     if problem_type == "classification":
         models = {
             "random_forest": RandomForestClassifier(random_state=42, n_estimators=10, max_depth=5, n_jobs=-1),
@@ -132,36 +147,62 @@ def get_model_instance(model_type: str, problem_type: str):
         raise ValueError(f"Unsupported model type '{model_type}' for {problem_type}.")
     return model
 
-def inspect_csv_service(file_contents: bytes):
-    """Reads CSV contents and returns columns and sample data."""
+def load_dataset(source: ingest.CsvSource, fingerprint: Optional[str] = None) -> pd.DataFrame:
+    """Returns the compact parsed dataset, reusing the stored parse of identical contents."""
+    if fingerprint is not None:
+        df = model_store.load_dataset(fingerprint)
+        if df is not None:
+            logger.info(f"Reusing parsed dataset {fingerprint[:12]}")
+            return df
+    df = compact_frame(ingest.load_csv(source, dtypes=ingest.infer_csv_dtypes(source)))
+    if fingerprint is not None:
+        try:
+            model_store.save_dataset(fingerprint, df)
+        except Exception as e:
+            logger.error(f"Could not store parsed dataset {fingerprint[:12]}: {e}")
+    return df
+
+def cache_dataset_service(source: ingest.CsvSource, fingerprint: str):
+    """Parses and stores a dataset ahead of training, in a training worker; failures are left for /train to report."""
     try:
-        df = pd.read_csv(io.BytesIO(file_contents))
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-        sample_data = df.head().replace({np.nan: None}).to_dict(orient='records')
-        return {"columns": df.columns.tolist(), "sample_data": sample_data}
+        load_dataset(source, fingerprint)
+    except Exception as e:
+        logger.warning(f"Could not pre-parse dataset {fingerprint[:12]}: {e}")
+
+def inspect_csv_service(source: ingest.CsvSource):
+    """Reads the first rows of a CSV and returns columns, sample data and dtypes inferred from a sample."""
+    try:
+        df = ingest.read_csv_head(source, nrows=5)
+        sample_data = df.replace({np.nan: None}).to_dict(orient='records')
+        dtypes = {col: str(dtype) for col, dtype in ingest.infer_csv_dtypes(source).items()}
+        return {"columns": df.columns.tolist(), "sample_data": sample_data, "dtypes": dtypes}
     except Exception as e:
         logger.error(f"Failed to read CSV: {e}")
         raise ValueError("Invalid CSV file. Please ensure it is correctly formatted.")
 
-def cancel_training_service():
-    """Sets the global flag to cancel training."""
-    global TRAINING_CANCELLED
-    TRAINING_CANCELLED = True
-    logger.info("Training cancellation signal received. The current training job will be stopped.")
-    return {"message": "Training cancellation signal sent successfully."}
+class TrainingCancelled(Exception):
+    """Raised inside a training run when its job has been cancelled."""
 
-def train_model_service(file_contents: bytes, request: TrainRequest):
-    """The core service for training a model from file contents."""
-    global TRAINING_CANCELLED
-    TRAINING_CANCELLED = False
+def fit_model_service(source: ingest.CsvSource, request: TrainRequest, progress: Optional[Callable[[str, float], None]] = None, is_cancelled: Optional[Callable[[], bool]] = None, fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    """Parses the dataset and fits the pipeline, without registering the model.
 
-    if TRAINING_CANCELLED:
-        logger.info("Training was cancelled before it began.")
-        return {"status": "cancelled", "message": "Training cancelled by user."}
+    Runs in training worker processes, so it only touches its arguments. progress is
+    called with (stage, fraction) and is_cancelled is polled between stages. With a
+    fingerprint, a dataset already parsed from identical contents is reused.
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import Pipeline
 
-    df = pd.read_csv(io.BytesIO(file_contents))
-    # FIX: Remove the "Unnamed: 0" column that pandas often adds
-    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+    def checkpoint(stage: str, fraction: float):
+        if is_cancelled is not None and is_cancelled():
+            logger.info(f"Training cancelled before stage '{stage}'.")
+            raise TrainingCancelled("Training cancelled by user.")
+        if progress is not None:
+            progress(stage, fraction)
+
+    checkpoint("loading", 0.1)
+    with metrics.span("train.load_dataset"):
+        df = load_dataset(source, fingerprint)
 
     if request.target_column not in df.columns:
         raise ValueError(f"Target column '{request.target_column}' not found in the dataset.")
@@ -169,206 +210,732 @@ def train_model_service(file_contents: bytes, request: TrainRequest):
     X = df.drop(columns=[request.target_column])
     y = df[request.target_column]
 
-    problem_type = "regression" if y.dtype != 'object' and y.nunique() >= 10 else "classification"
+    problem_type = "regression" if pd.api.types.is_numeric_dtype(y) and y.nunique() >= 10 else "classification"
     logger.info(f"Detected problem type: {problem_type}")
 
+    checkpoint("preprocessing", 0.3)
     numeric_features = X.select_dtypes(include=np.number).columns.tolist()
     categorical_features = X.select_dtypes(include=['object', 'category']).columns.tolist()
 
-    numeric_transformer = Pipeline(steps=[('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())])
-    categorical_transformer = Pipeline(steps=[('imputer', SimpleImputer(strategy='most_frequent')), ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False, drop='first'))])
-
-    transformers = []
-    if numeric_features:
-        transformers.append(('num', numeric_transformer, numeric_features))
-    if categorical_features:
-        transformers.append(('cat', categorical_transformer, categorical_features))
-
-    preprocessor = ColumnTransformer(transformers=transformers, remainder='drop')
+    preprocessor, preprocessing = build_preprocessor(X, y, numeric_features, categorical_features, request, problem_type)
     model = get_model_instance(request.model_type, problem_type)
     pipeline = Pipeline(steps=[('preprocessor', preprocessor), ('classifier', model)])
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    if TRAINING_CANCELLED:
-        logger.info("Training cancelled before model fitting.")
-        return {"status": "cancelled", "message": "Training cancelled by user."}
-
-    pipeline.fit(X_train, y_train)
+    # Splits are kept as row positions into the one compact frame instead of four copies
+    train_idx, test_idx = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42)
+
+    tuning_report = None
+    if request.tune:
+        checkpoint("tuning", 0.35)
+        with metrics.span("train.tune"):
+            best_params, tuning_report = tuning.search(
+                model, request.model_type.value, problem_type, preprocessor, X.iloc[train_idx], y.iloc[train_idx],
+                strategy=request.search_strategy.value, n_candidates=request.n_candidates, cv_folds=request.cv_folds,
+                time_budget_seconds=request.time_budget_seconds, is_cancelled=is_cancelled,
+                progress=None if progress is None else lambda fraction: progress("tuning", 0.35 + 0.4 * fraction),
+            )
+        model.set_params(**best_params)
+
+    checkpoint("fitting", 0.8 if request.tune else 0.5)
+    with metrics.span("train.fit"):
+        pipeline.fit(X.iloc[train_idx], y.iloc[train_idx])
+    with metrics.span("train.evaluate"):
+        test_metrics = tuning.score_test_split(pipeline, X.iloc[test_idx], y.iloc[test_idx], problem_type)
+    checkpoint("fitted", 0.9)
+    preprocessing["sparse_output"] = bool(preprocessor.sparse_output_)
+    preprocessing["transformed_features"] = max((indices.stop for indices in preprocessor.output_indices_.values()), default=0)
 
-    model_id = str(uuid.uuid4())
-    MODELS_CACHE[model_id] = {
-        "pipeline": pipeline, "X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test,
+    return {
+        "pipeline": pipeline, "data": df, "train_idx": train_idx, "test_idx": test_idx,
         "feature_names": X.columns.tolist(), "categorical_features": categorical_features,
         "numeric_features": numeric_features, "problem_type": problem_type,
         "target_column": request.target_column, "preprocessor": preprocessor, "model": model,
-        "original_data": df, "created_at": datetime.now().isoformat()
+        "model_type": request.model_type.value, "dataset_fingerprint": fingerprint, "created_at": datetime.now().isoformat(),
+        "test_metrics": test_metrics, "tuning": tuning_report, "preprocessing": preprocessing,
     }
-    FEEDBACK_CACHE[model_id] = []
-    logger.info(f"Model {model_id} trained and cached.")
 
+def build_preprocessor(X: pd.DataFrame, y: pd.Series, numeric_features: List[str], categorical_features: List[str], request: TrainRequest, problem_type: str):
+    """The unfitted ColumnTransformer for a training frame, and a report of the categorical encoding chosen.
+
+    "onehot" keeps the dense one-hot encoding. "sparse" one-hot encodes into a CSR matrix,
+    grouping categories rarer than MIN_CATEGORY_FREQUENCY or beyond MAX_ONEHOT_CATEGORIES into
+    one infrequent column, and replaces columns with more than HIGH_CARDINALITY levels by one
+    code each: ordinal for tree models, target means for linear models on binary or
+    regression targets. "auto" is "onehot" unless a column has more than
+    DENSE_ONEHOT_MAX_LEVELS levels.
+    """
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, TargetEncoder
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.impute import SimpleImputer
+
+    levels = {col: int(X[col].nunique()) for col in categorical_features}
+    encoding = request.categorical_encoding.value
+    if encoding == "auto":
+        encoding = "sparse" if levels and max(levels.values()) > DENSE_ONEHOT_MAX_LEVELS else "onehot"
+
+    transformers = []
+    if numeric_features:
+        transformers.append(('num', Pipeline(steps=[('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())]), numeric_features))
+    if encoding == "onehot":
+        if categorical_features:
+            transformers.append(('cat', Pipeline(steps=[('imputer', SimpleImputer(strategy='most_frequent')), ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False, drop='first'))]), categorical_features))
+        return ColumnTransformer(transformers=transformers, remainder='drop'), {"categorical_encoding": encoding, "encoders": {col: "onehot" for col in categorical_features}}
+
+    tree_model = request.model_type.value in ("random_forest", "decision_tree")
+    single_target = problem_type == "regression" or y.nunique() == 2
+    encoders = {}
+    for col in categorical_features:
+        if levels[col] <= HIGH_CARDINALITY or not (tree_model or single_target):
+            encoders[col] = "onehot"
+        else:
+            encoders[col] = "ordinal" if tree_model else "target"
+    steps = {
+        "onehot": OneHotEncoder(handle_unknown='infrequent_if_exist', min_frequency=MIN_CATEGORY_FREQUENCY, max_categories=MAX_ONEHOT_CATEGORIES, sparse_output=True),
+        "ordinal": OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1),
+        "target": TargetEncoder(random_state=42),
+    }
+    for kind, name in (("onehot", "cat"), ("ordinal", "ordinal"), ("target", "target")):
+        columns = [col for col in categorical_features if encoders[col] == kind]
+        if columns:
+            transformers.append((name, Pipeline(steps=[('imputer', SimpleImputer(strategy='most_frequent')), (kind, steps[kind])]), columns))
+    logger.info(f"Sparse categorical encoding: {sum(k == 'onehot' for k in encoders.values())} one-hot, {sum(k != 'onehot' for k in encoders.values())} high-cardinality columns")
+    # Any sparse block keeps the whole output sparse
+    return ColumnTransformer(transformers=transformers, remainder='drop', sparse_threshold=1.0), {"categorical_encoding": encoding, "encoders": encoders}
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Stores text columns as categoricals and downcasts integer columns to the smallest lossless type.
+
+    Float columns stay float64: the scaler keeps float32 input in float32, which would
+    change the fitted model rather than only its storage.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_float_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+            pass
+        elif pd.api.types.is_integer_dtype(values) and isinstance(values.dtype, np.dtype):
+            values = pd.to_numeric(values, downcast='integer')
+        elif not pd.api.types.is_numeric_dtype(values):
+            values = values.astype('category')
+        columns[col] = values
+    return pd.DataFrame(columns, index=df.index)
+
+_EVICTION_CALLBACKS: List[Callable[[str], None]] = []
+
+def on_model_evicted(callback: Callable[[str], None]):
+    """Registers callback(model_id) to drop per-model state when a model leaves memory."""
+    _EVICTION_CALLBACKS.append(callback)
+
+def cache_model(model_id: str, model_data: Dict[str, Any]):
+    """Makes a model resident, evicting the least recently used persisted models over budget."""
+    with _MODELS_LOCK:
+        MODELS_CACHE[model_id] = model_data
+        MODELS_CACHE.move_to_end(model_id)
+        # Models that failed to persist have no stored_bytes and are never evicted
+        evictable = [mid for mid, data in MODELS_CACHE.items() if mid != model_id and data.get("stored_bytes") is not None]
+        resident_bytes = sum(data.get("stored_bytes") or 0 for data in MODELS_CACHE.values())
+        while evictable and (len(MODELS_CACHE) > MAX_RESIDENT_MODELS or resident_bytes > MAX_RESIDENT_BYTES):
+            evicted_id = evictable.pop(0)
+            resident_bytes -= MODELS_CACHE.pop(evicted_id).get("stored_bytes") or 0
+            explainers.invalidate_explainers(evicted_id)
+            FEEDBACK_STATS.pop(evicted_id, None)
+            for callback in _EVICTION_CALLBACKS:
+                callback(evicted_id)
+            logger.info(f"Evicted model {evicted_id} from memory; it stays in the model store.")
+
+def get_model_data(model_id: str) -> Optional[Dict[str, Any]]:
+    """Returns a resident model, lazily opening it from the model store if needed."""
+    with _MODELS_LOCK:
+        model_data = MODELS_CACHE.get(model_id)
+        if model_data is not None:
+            MODELS_CACHE.move_to_end(model_id)
+            return model_data
+    with metrics.span("model.load"):
+        model_data = model_store.load_model(model_id)
+    if model_data is None:
+        return None
+    logger.info(f"Model {model_id} loaded from the model store.")
+    cache_model(model_id, model_data)
+    return model_data
+
+def warm_up_model(model_id: str, build_explainers: bool = True):
+    """Loads a stored model and, with build_explainers, builds its explainers and explains one training row.
+
+    The explanation runs every SHAP/LIME code path once, so the first real request
+    doesn't pay for lazy imports and one-off initialization.
+    """
+    model_data = get_model_data(model_id)
+    if model_data is None or not build_explainers:
+        return
+    params = get_explanation_parameters(model_id)
+    X_train, _ = model_store.training_split(model_data, "train")
+    explain_data_point(model_id, X_train.iloc[0].to_dict(), params)
+
+def model_memory_report(model_id: str, model_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Bytes held by one resident model's training snapshot and cached explainers."""
+    data = model_data["data"]
+    data_bytes = int(data.memory_usage(deep=True, index=True).sum())
+    split_bytes = int(model_data["train_idx"].nbytes + model_data["test_idx"].nbytes)
+    explainer_bytes = explainers.cached_bytes(model_id)
+    return {
+        "model_id": model_id, "rows": len(data), "columns": data.shape[1],
+        "data_bytes": data_bytes, "split_index_bytes": split_bytes, "explainer_bytes": explainer_bytes,
+        "total_bytes": data_bytes + split_bytes + explainer_bytes, "stored_bytes": model_data.get("stored_bytes"),
+        "dtypes": {str(col): str(dtype) for col, dtype in data.dtypes.items()},
+    }
+
+def memory_report_service(model_id: Optional[str] = None) -> Dict[str, Any]:
+    """Memory report for one model, or for every model currently resident."""
+    if model_id is not None:
+        model_data = get_model_data(model_id)
+        if model_data is None:
+            raise ValueError("Model not found. Please train the model first.")
+        return model_memory_report(model_id, model_data)
+    with _MODELS_LOCK:
+        resident = list(MODELS_CACHE.items())
+    models = [model_memory_report(mid, data) for mid, data in resident]
+    return {"resident_models": len(models), "total_bytes": sum(m["total_bytes"] for m in models), "models": models}
+
+def build_train_response(model_id: str, model_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The /train payload for a freshly fitted model."""
+    df = model_data["data"]
     return {
-        "model_id": model_id, "message": "Model trained successfully.", "columns": X.columns.tolist(),
-        "problem_type": problem_type, "target_column": request.target_column,
-        "numeric_columns": numeric_features,
+        "model_id": model_id, "message": "Model trained successfully.", "columns": model_data["feature_names"],
+        "problem_type": model_data["problem_type"], "target_column": model_data["target_column"],
+        "numeric_columns": model_data["numeric_features"],
         "sample_data": df.head(10).replace({np.nan: None}).to_dict(orient='records'),
+        "test_metrics": model_data.get("test_metrics"), "tuning": model_data.get("tuning"),
+        "preprocessing": model_data.get("preprocessing"),
     }
 
-def explain_model_service(request: ExplainRequest):
-    """The core service for generating explanations with feedback-based adjustments."""
+def persist_trained_model(model_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Writes a fitted model to the model store under a new id and builds the training response.
+
+    Training workers call this so only the small response travels back to the API process,
+    which then opens the model lazily from the store.
+    """
+    model_id = str(uuid.uuid4())
+    with metrics.span("train.persist"):
+        model_store.save_model(model_id, model_data)
+    return build_train_response(model_id, model_data)
+
+def register_trained_model(model_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Persists and caches a fitted model under a new id and builds the training response."""
+    model_id = str(uuid.uuid4())
+    response = build_train_response(model_id, model_data)
     try:
-        model_data = MODELS_CACHE.get(request.model_id)
-        if not model_data:
-            raise ValueError("Model not found. Please train the model first.")
-        
-        avg_rating = 3.0
-        if request.model_id in FEEDBACK_CACHE and FEEDBACK_CACHE[request.model_id]:
-            ratings = [f['rating'] for f in FEEDBACK_CACHE[request.model_id]]
-            avg_rating = sum(ratings) / len(ratings)
-        
-        params = adjust_explanation_parameters(request.model_id, avg_rating)
-        
-        pipeline = model_data["pipeline"]
-        X_train = model_data["X_train"]
-        feature_names = model_data["feature_names"]
-        problem_type = model_data["problem_type"]
-        categorical_features = model_data["categorical_features"]
-        numeric_features = model_data["numeric_features"]
-        
-        data_point_df = pd.DataFrame([request.data_point])
-        for col in feature_names:
-            if col not in data_point_df.columns:
-                data_point_df[col] = 'unknown' if col in categorical_features else 0
-        data_point_df = data_point_df[feature_names]
-        
-        for col in feature_names:
-            if col in categorical_features:
-                data_point_df[col] = data_point_df[col].astype(str)
-            elif col in numeric_features:
-                data_point_df[col] = pd.to_numeric(data_point_df[col], errors='coerce').fillna(0)
-        
-        preprocessor = pipeline.named_steps['preprocessor']
-        model = pipeline.named_steps['classifier']
-        
-        X_train_transformed = preprocessor.transform(X_train)
-        data_point_transformed = preprocessor.transform(data_point_df)
-        
-        try:
-            transformed_feature_names = preprocessor.get_feature_names_out()
-        except:
-            transformed_feature_names = [f"feature_{i}" for i in range(X_train_transformed.shape[1])]
-        
-        shap_explanation = None
-        try:
-            if params["use_tree_explainer"] and hasattr(model, 'feature_importances_'):
-                explainer = shap.TreeExplainer(model)
-                shap_values_raw = explainer.shap_values(data_point_transformed)
-                shap_values = shap_values_raw[1].flatten() if isinstance(shap_values_raw, list) and len(shap_values_raw) > 1 else (shap_values_raw[0].flatten() if isinstance(shap_values_raw, list) else shap_values_raw.flatten())
-                base_value = explainer.expected_value
-                base_value = base_value[1] if isinstance(base_value, (list, np.ndarray)) and len(base_value) > 1 else (base_value[0] if isinstance(base_value, (list, np.ndarray)) else base_value)
-                base_value_float = safe_float_conversion(base_value)
-                shap_values_list = [safe_float_conversion(val) for val in shap_values]
-                feature_importance = sorted(list(zip(transformed_feature_names, shap_values_list)), key=lambda x: abs(x[1]), reverse=True)
-                top_features = feature_importance[:params["num_features"]]
-                shap_explanation = {"features": [f[0] for f in top_features], "shap_values": [f[1] for f in top_features], "base_value": base_value_float, "explainer_type": "TreeExplainer", "reliability_score": calculate_reliability_score(request.model_id, "shap")}
+        model_store.save_model(model_id, model_data)
+        # Swap the in-memory frames for the memory-mapped copies
+        model_data = model_store.load_model(model_id)
+    except Exception as e:
+        logger.error(f"Could not persist model {model_id}; keeping it in memory only: {e}")
+    cache_model(model_id, model_data)
+    logger.info(f"Model {model_id} trained and cached.")
+    return response
+
+def training_key(fingerprint: str, request: TrainRequest) -> str:
+    """Identifies a training run by dataset contents and every setting that shapes the model.
+
+    Training is deterministic (fixed split and random_state), so equal keys produce equal models.
+    time_budget_seconds is left out: it only matters when it cuts the search short, and such
+    runs are never remembered (see remember_trained_model).
+    """
+    settings = request.model_dump(mode="json", exclude={"time_budget_seconds"})
+    return f"{fingerprint}:{json.dumps(settings, sort_keys=True)}"
+
+def _index_trained_model(key: str, model_id: str):
+    TRAINED_MODEL_INDEX[key] = model_id
+    TRAINED_MODEL_INDEX.move_to_end(key)
+    while len(TRAINED_MODEL_INDEX) > MAX_TRAINED_MODEL_INDEX:
+        TRAINED_MODEL_INDEX.popitem(last=False)
+
+def find_trained_model(key: str) -> Optional[Dict[str, Any]]:
+    """The training response of a model already trained under this key, if it still exists."""
+    model_id = TRAINED_MODEL_INDEX.get(key) or model_store.find_training_key(key)
+    if model_id is None:
+        return None
+    model_data = get_model_data(model_id)
+    if model_data is None:
+        TRAINED_MODEL_INDEX.pop(key, None)
+        model_store.forget_training_key(key)
+        return None
+    _index_trained_model(key, model_id)
+    logger.info(f"Reusing model {model_id} trained on identical data and settings.")
+    return {**build_train_response(model_id, model_data), "message": "Identical model already trained; reusing it."}
+
+def remember_trained_model(key: str, response: Dict[str, Any]):
+    """Records which model a training key produced so identical requests can reuse it.
+
+    Runs whose search was stopped by the time budget depend on timing, so they are not recorded.
+    """
+    if (response.get("tuning") or {}).get("stopped") == "time_budget":
+        return
+    model_id = response["model_id"]
+    _index_trained_model(key, model_id)
+    try:
+        model_store.save_training_key(key, model_id)
+    except OSError as e:
+        logger.warning(f"Could not persist training key for model {model_id}: {e}")
+
+def train_model_service(source: ingest.CsvSource, request: TrainRequest):
+    """The core service for training a model from a CSV path or file contents."""
+    fingerprint = ingest.fingerprint(source)
+    key = training_key(fingerprint, request)
+    response = find_trained_model(key)
+    if response is None:
+        response = register_trained_model(fit_model_service(source, request, fingerprint=fingerprint))
+        remember_trained_model(key, response)
+    return response
+
+def get_explanation_parameters(model_id: str) -> Dict[str, Any]:
+    """Returns the explanation parameters selected by the model's feedback so far."""
+    avg_rating = feedback.average_rating(get_feedback_stats(model_id))
+    return adjust_explanation_parameters(model_id, 3.0 if avg_rating is None else avg_rating)
+
+def prepare_data_frame(model_data: Dict[str, Any], data: pd.DataFrame) -> pd.DataFrame:
+    """Aligns raw rows to the model's feature columns, filling missing columns and coercing types."""
+    feature_names = model_data["feature_names"]
+    categorical_features = model_data["categorical_features"]
+    numeric_features = model_data["numeric_features"]
+    data = data.copy()
+    for col in feature_names:
+        if col not in data.columns:
+            data[col] = 'unknown' if col in categorical_features else 0
+    data = data[feature_names]
+    for col in feature_names:
+        if col in categorical_features:
+            data[col] = data[col].astype(str)
+        elif col in numeric_features:
+            data[col] = pd.to_numeric(data[col], errors='coerce').fillna(0)
+    return data
+
+def label_metrics(model_data: Dict[str, Any]):
+    """Tags the current request's timing spans with the model type being served."""
+    metrics.set_model_type(model_data.get("model_type") or type(model_data["model"]).__name__)
+
+def _json_scalar(value):
+    return value.item() if hasattr(value, "item") else value
+
+def predict_service(model_id: str, data: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Predictions for every row of a frame, with class probabilities for classifiers."""
+    model_data = get_model_data(model_id)
+    if not model_data:
+        raise ValueError("Model not found. Please train the model first.")
+    label_metrics(model_data)
+    model = model_data["model"]
+    with metrics.span("preprocess"):
+        X_transformed = model_data["preprocessor"].transform(prepare_data_frame(model_data, data))
+    with metrics.span("predict"):
+        predictions = model.predict(X_transformed)
+        if model_data["problem_type"] != "classification" or not hasattr(model, "predict_proba"):
+            return [{"prediction": _json_scalar(p)} for p in predictions]
+        probabilities = model.predict_proba(X_transformed)
+    classes = [str(_json_scalar(c)) for c in model.classes_]
+    return [{"prediction": _json_scalar(p), "probabilities": dict(zip(classes, map(float, row)))} for p, row in zip(predictions, probabilities)]
+
+def _positive_output(values):
+    """Selects the positive-class output from SHAP results that carry a trailing class axis."""
+    if isinstance(values, list):
+        return values[1] if len(values) > 1 else values[0]
+    values = np.asarray(values)
+    return values[..., 1] if values.ndim > 2 else values
+
+def _base_value(explainer) -> float:
+    """The explainer's expected value for the positive class, or its only output."""
+    base_value = explainer.expected_value
+    base_value = base_value[1] if isinstance(base_value, (list, np.ndarray)) and len(base_value) > 1 else (base_value[0] if isinstance(base_value, (list, np.ndarray)) else base_value)
+    return safe_float_conversion(base_value)
+
+def compute_shap_values(artifacts: Dict[str, Any], X_transformed, nsamples: Optional[int] = None) -> Tuple[np.ndarray, float]:
+    """Returns SHAP values with shape (rows, transformed features) and the matching base value.
+
+    nsamples caps the model evaluations KernelExplainer spends per row.
+    """
+    if "shap_explainer" not in artifacts:
+        raise ValueError(artifacts.get("shap_error", "SHAP explainer unavailable"))
+    explainer = explainers.fresh_shap_explainer(artifacts)
+    X_transformed = explainers.to_dense(X_transformed)
+    kwargs = {"nsamples": nsamples} if nsamples is not None and artifacts["shap_explainer_type"] == "KernelExplainer" else {}
+    with metrics.span("shap.values"):
+        shap_values = np.asarray(_positive_output(explainer.shap_values(X_transformed, **kwargs)), dtype=float)
+    shap_values = shap_values.reshape(X_transformed.shape[0], -1)
+    return shap_values, _base_value(explainer)
+
+def compute_adaptive_shap_values(artifacts: Dict[str, Any], x_transformed, tolerance: float, latency_budget_ms: Optional[float] = None) -> Tuple[np.ndarray, float, Dict[str, Any]]:
+    """Kernel SHAP values of one row, sampled until they converge or the latency budget runs out.
+
+    Each chunk is an independent KernelExplainer estimate over SHAP_CHUNK_SAMPLES coalitions,
+    without feature selection so that estimates can be averaged. Chunks run in rounds on a
+    thread pool; sampling stops once at least SHAP_MIN_CHUNKS estimates agree, with the
+    standard error of every averaged attribution within tolerance. Under a latency budget each
+    round is sized to the time left, from the cost per chunk measured for this model, and the
+    first request for a model probes that cost with a single chunk. Returns the values, the
+    base value and a report of the achieved variance.
+    """
+    if "shap_explainer" not in artifacts:
+        raise ValueError(artifacts.get("shap_error", "SHAP explainer unavailable"))
+    x_transformed = explainers.to_dense(x_transformed)
+    nsamples = max(SHAP_CHUNK_SAMPLES, 2 * x_transformed.shape[1] + 2)
+    round_size = max(2, SHAP_PARALLEL_CHUNKS)
+    min_chunks = max(2, min(SHAP_MIN_CHUNKS, SHAP_MAX_CHUNKS))
+
+    def estimate(_):
+        explainer = explainers.fresh_shap_explainer(artifacts)
+        values = explainer.shap_values(x_transformed, nsamples=nsamples, l1_reg=0, silent=True)
+        # Fewer coalitions than requested when they can all be enumerated
+        evaluated.append(explainer.nsamples)
+        return np.asarray(_positive_output(values), dtype=float).reshape(-1)
+
+    started = time.perf_counter()
+    estimates: List[np.ndarray] = []
+    evaluated: List[int] = []
+    variance = None
+    stop_reason = "max_chunks"
+    with metrics.span("shap.values"):
+        while len(estimates) < SHAP_MAX_CHUNKS:
+            size = min(round_size, SHAP_MAX_CHUNKS - len(estimates))
+            if latency_budget_ms is not None:
+                # Wall time per chunk of a round, so parallel speedup shows up in the estimate
+                chunk_seconds = artifacts.get("kernel_chunk_seconds")
+                if chunk_seconds is None:
+                    size = 1
+                else:
+                    remaining = latency_budget_ms / 1000 - (time.perf_counter() - started)
+                    size = min(size, int(remaining / chunk_seconds))
+                    if size < 1 and estimates:
+                        stop_reason = "latency_budget"
+                        break
+                    size = max(size, 1)
+            round_started = time.perf_counter()
+            estimates.extend(_SHAP_POOL.map(estimate, range(size)))
+            artifacts["kernel_chunk_seconds"] = (time.perf_counter() - round_started) / size
+            if len(estimates) < 2:
+                continue
+            variance = np.var(estimates, axis=0, ddof=1) / len(estimates)
+            if len(estimates) >= min_chunks and np.sqrt(variance.max()) <= tolerance:
+                stop_reason = "converged"
+                break
+    report = {
+        "chunks": len(estimates), "nsamples": int(sum(evaluated)), "stop_reason": stop_reason,
+        # A single estimate has no measurable variance
+        "max_std_error": None if variance is None else float(np.sqrt(variance.max())), "tolerance": tolerance, "latency_budget_ms": latency_budget_ms,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3), "variance": variance,
+    }
+    return np.mean(estimates, axis=0)[np.newaxis, :], _base_value(artifacts["shap_explainer"]), report
+
+def top_shap_features(feature_names: List[str], shap_values: np.ndarray, k: int) -> Dict[str, List]:
+    """Top-k features of one row of SHAP values, ordered by absolute contribution."""
+    feature_importance = sorted(zip(feature_names, (float(v) for v in shap_values)), key=lambda x: abs(x[1]), reverse=True)[:k]
+    return {"features": [f[0] for f in feature_importance], "shap_values": [f[1] for f in feature_importance]}
+
+def encode_for_lime(data: pd.DataFrame, label_encoders: Dict[str, Any]) -> np.ndarray:
+    """Label-encodes categorical columns the same way the LIME training data was encoded."""
+    data = data.copy()
+    for col, le in label_encoders.items():
+        codes = {label: code for code, label in enumerate(le.classes_)}
+        data[col] = data[col].astype(str).map(codes).fillna(-1).astype(int)
+    data.fillna(0, inplace=True)
+    return data.values
+
+def _lime_predict_fn(model_data: Dict[str, Any], artifacts: Dict[str, Any]):
+    """Prediction function LIME calls on label-encoded perturbations.
+
+    When the preprocessor allows it, perturbations are mapped straight into the transformed
+    feature space and passed to the estimator, skipping the ColumnTransformer.
+    """
+    pipeline = model_data["pipeline"]
+    model = model_data["model"]
+    feature_names = model_data["feature_names"]
+    problem_type = model_data["problem_type"]
+    label_encoders = artifacts["label_encoders"]
+    lime_transform = artifacts.get("lime_transform")
+    if lime_transform is not None:
+        def predict_fn_lime(x):
+            with metrics.span("lime.predict"):
+                x_model = explainers.lime_rows_to_model_input(lime_transform, x)
+                return model.predict_proba(x_model) if problem_type == "classification" else model.predict(x_model).reshape(-1, 1)
+        return predict_fn_lime
+
+    def predict_fn_lime(x):
+        df_pred = pd.DataFrame(x, columns=feature_names)
+        for col, le in label_encoders.items():
+            if col in df_pred.columns:
+                codes = df_pred[col].astype(int).to_numpy()
+                valid = (codes >= 0) & (codes < len(le.classes_))
+                decoded = np.full(len(codes), explainers.UNKNOWN_CATEGORY, dtype=object)
+                decoded[valid] = le.classes_[codes[valid]]
+                df_pred[col] = decoded
+        predict_fn = pipeline.predict_proba if problem_type == "classification" else lambda d: pipeline.predict(d).reshape(-1, 1)
+        with metrics.span("lime.predict"):
+            return predict_fn(df_pred)
+    return predict_fn_lime
+
+def map_lime_features(model_data: Dict[str, Any], lime_list: List[Tuple[str, float]], feature_map: Optional[Dict[str, Dict[str, Any]]] = None, row: Optional[Dict[str, Any]] = None, transformed_feature_names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Maps LIME's feature descriptions onto the transformed feature names SHAP reports.
+
+    feature_map, from explainers.transformed_feature_map, gives each column's transformer
+    prefix; ordinal and target encoded columns have a single transformed feature, and
+    infrequent one-hot categories share theirs. LIME sees categorical columns as label
+    codes, so a one-hot column's weight goes to the category of the explained row, or to
+    the infrequent column when that category has no column of its own, e.g. an unseen one.
+    With transformed_feature_names, weights of categories no transformed feature encodes,
+    such as a dropped reference category, are left out.
+    """
+    feature_names = model_data["feature_names"]
+    numeric_features = model_data["numeric_features"]
+    categorical_features = model_data["categorical_features"]
+    feature_map = feature_map or {}
+    known_names = set(transformed_feature_names) if transformed_feature_names is not None else None
+    processed_lime_exp = {}
+    for feature_str, value in lime_list:
+        base_feature = None
+        for name in feature_names:
+            if re.match(rf"^{re.escape(name)}\b", feature_str):
+                base_feature = name
+                break
+
+        if not base_feature:
+            continue
+
+        if base_feature in numeric_features:
+            transformed_name = f"{feature_map.get(base_feature, {}).get('prefix', 'num')}__{base_feature}"
+            if known_names is None or transformed_name in known_names:
+                processed_lime_exp[transformed_name] = processed_lime_exp.get(transformed_name, 0) + value
+        elif base_feature in categorical_features:
+            encoding = feature_map.get(base_feature, {"prefix": "cat", "onehot": True, "infrequent": set()})
+            prefix = encoding["prefix"]
+            match = re.search(r"=\s*(.+)", feature_str)
+            has_category = row is not None and not pd.isna(row.get(base_feature))
+            if encoding["onehot"] and (has_category or match):
+                category = str(row[base_feature]) if has_category else match.group(1).strip()
+                transformed_name = f"{prefix}__{base_feature}_{category}"
+                infrequent_name = f"{prefix}__{base_feature}_infrequent_sklearn"
+                if category in encoding["infrequent"] or (known_names is not None and transformed_name not in known_names and infrequent_name in known_names):
+                    transformed_name = infrequent_name
             else:
-                background_sample = shap.sample(X_train_transformed, params["shap_samples"])
-                predict_fn = model.predict_proba if problem_type == "classification" and hasattr(model, 'predict_proba') else model.predict
-                explainer = shap.KernelExplainer(predict_fn, background_sample)
-                shap_values_raw = explainer.shap_values(data_point_transformed)
-                shap_values = shap_values_raw[1][0] if isinstance(shap_values_raw, list) and len(shap_values_raw) > 1 else (shap_values_raw[0][0] if isinstance(shap_values_raw, list) else shap_values_raw[0])
-                base_value = explainer.expected_value
-                base_value = base_value[1] if isinstance(base_value, (list, np.ndarray)) and len(base_value) > 1 else (base_value[0] if isinstance(base_value, (list, np.ndarray)) else base_value)
-                base_value_float = safe_float_conversion(base_value)
-                shap_values_list = [safe_float_conversion(val) for val in shap_values]
-                feature_importance = sorted(list(zip(transformed_feature_names, shap_values_list)), key=lambda x: abs(x[1]), reverse=True)
-                top_features = feature_importance[:params["num_features"]]
-                shap_explanation = {"features": [f[0] for f in top_features], "shap_values": [f[1] for f in top_features], "base_value": base_value_float, "explainer_type": "KernelExplainer", "reliability_score": calculate_reliability_score(request.model_id, "shap")}
-        except Exception as e:
-            logger.error(f"SHAP explanation failed: {e}")
-            shap_explanation = {"features": ["Error"], "shap_values": [0], "base_value": 0, "explainer_type": "ErrorFallback", "reliability_score": 0.1}
+                transformed_name = f"{prefix}__{base_feature}"
+            if known_names is None or transformed_name in known_names:
+                processed_lime_exp[transformed_name] = value
+    return processed_lime_exp
+
+def compute_lime_explanations(model_data: Dict[str, Any], artifacts: Dict[str, Any], data: pd.DataFrame, params: Dict[str, Any]) -> List[Dict[str, float]]:
+    """LIME explanations for every row of a prepared frame, with model predictions batched across rows."""
+    if "lime_explainer" not in artifacts:
+        raise ValueError(artifacts.get("lime_error", "LIME explainer unavailable"))
+    label_encoders = artifacts["label_encoders"]
+    rows = encode_for_lime(data, label_encoders)
+    predict_fn = _lime_predict_fn(model_data, artifacts)
+    with metrics.span("lime.explain"):
+        lime_exps = explainers.explain_lime_rows(artifacts, rows, predict_fn, num_features=params["num_features"], num_samples=params["lime_samples"])
+    feature_map = artifacts.get("feature_map")
+    names = set(artifacts["transformed_feature_names"])
+    return [map_lime_features(model_data, lime_exp.as_list(), feature_map, row, names) for lime_exp, row in zip(lime_exps, data.to_dict(orient="records"))]
+
+def with_current_reliability(model_id: str, stored: Dict[str, Any], explanation_id: str) -> Dict[str, Any]:
+    """A stored explanation with reliability scores reflecting the feedback received since."""
+    return {
+        "shap": {**stored["shap"], "reliability_score": calculate_reliability_score(model_id, "shap")},
+        "lime": {**stored["lime"], "reliability_score": calculate_reliability_score(model_id, "lime")},
+        "overall_reliability": calculate_reliability_score(model_id, "both"), "explanation_id": explanation_id,
+    }
 
-        lime_explanation = None
-        try:
-            X_train_numeric = X_train.copy()
-            data_point_numeric = data_point_df.copy()
-            label_encoders = {}
-            for col in categorical_features:
-                if col in X_train_numeric.columns:
-                    le = LabelEncoder()
-                    X_train_numeric[col] = le.fit_transform(X_train_numeric[col].astype(str))
-                    label_encoders[col] = le
-                    try:
-                        data_point_numeric[col] = le.transform(data_point_numeric[col].astype(str))
-                    except ValueError:
-                        data_point_numeric[col] = -1
-            X_train_numeric.fillna(0, inplace=True)
-            data_point_numeric.fillna(0, inplace=True)
-            lime_explainer = lime.lime_tabular.LimeTabularExplainer(training_data=X_train_numeric.values, feature_names=feature_names, class_names=['0', '1'] if problem_type == "classification" else None, mode=problem_type, discretize_continuous=params["discretize_continuous"], random_state=42)
-            def predict_fn_lime(x):
-                df_pred = pd.DataFrame(x, columns=feature_names)
-                for col, le in label_encoders.items():
-                    if col in df_pred.columns:
-                        try:
-                            df_pred[col] = le.inverse_transform(df_pred[col].astype(int))
-                        except:
-                            df_pred[col] = 'unknown'
-                predict_fn = pipeline.predict_proba if problem_type == "classification" else lambda d: pipeline.predict(d).reshape(-1, 1)
-                return predict_fn(df_pred)
-            lime_exp = lime_explainer.explain_instance(data_point_numeric.iloc[0].values, predict_fn_lime, num_features=params["num_features"], num_samples=params["lime_samples"])
-            
-            # FIX: Process LIME results to match SHAP's feature format
-            lime_list = lime_exp.as_list()
-            processed_lime_exp = {}
-            for feature_str, value in lime_list:
-                base_feature = None
-                for name in feature_names:
-                    if re.match(rf"^{re.escape(name)}\b", feature_str):
-                        base_feature = name
-                        break
-                
-                if not base_feature:
-                    continue
-
-                if base_feature in numeric_features:
-                    transformed_name = f"num__{base_feature}"
-                    processed_lime_exp[transformed_name] = processed_lime_exp.get(transformed_name, 0) + value
-                elif base_feature in categorical_features:
-                    match = re.search(r"=\s*(.+)", feature_str)
-                    if match:
-                        val_part = match.group(1).strip()
-                        transformed_name = f"cat__{base_feature}_{val_part}"
-                        processed_lime_exp[transformed_name] = value
-                    else:
-                        processed_lime_exp[f"cat__{base_feature}"] = value
-
-            lime_explanation = {"lime_explanation": processed_lime_exp, "reliability_score": calculate_reliability_score(request.model_id, "lime")}
-        except Exception as e:
-            logger.error(f"LIME explanation failed: {e}")
-            lime_explanation = {"lime_explanation": {"Error": 0}, "reliability_score": 0.1}
+def get_explanation_service(explanation_id: str) -> Dict[str, Any]:
+    """Looks up a stored explanation by the explanation_id /explain returned."""
+    stored = explanation_store.get(explanation_id, count=False)
+    if stored is None:
+        raise KeyError("Explanation not found or expired.")
+    return {**with_current_reliability(stored["model_id"], stored, explanation_id), "model_id": stored["model_id"], "timestamp": stored["timestamp"], "parameters_used": stored["parameters_used"]}
+
+def explain_data_point(model_id: str, data_point: Dict[str, Any], params: Dict[str, Any], sampling: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+    """Computes the SHAP and LIME explanations of one data point with the given parameters.
+
+    With sampling ({"tolerance", "latency_budget_ms"}), KernelExplainer samples adaptively
+    and the SHAP explanation reports the variance it reached. Returns both explanations
+    without reliability scores and whether either of them failed. Runs in the API process
+    or in an explanation worker, so it reads no feedback state.
+    """
+    model_data = get_model_data(model_id)
+    if not model_data:
+        raise ValueError("Model not found. Please train the model first.")
+    label_metrics(model_data)
+    preprocessor = model_data["pipeline"].named_steps['preprocessor']
+    artifacts = explainers.get_explainer_artifacts(model_id, model_data, params)
+    with metrics.span("preprocess"):
+        data_point_df = prepare_data_frame(model_data, pd.DataFrame([data_point]))
+        data_point_transformed = preprocessor.transform(data_point_df)
+
+    failed = False
+    try:
+        report = None
+        if sampling is not None and artifacts.get("shap_explainer_type") == "KernelExplainer":
+            shap_values, base_value, report = compute_adaptive_shap_values(artifacts, data_point_transformed, sampling["tolerance"], sampling["latency_budget_ms"])
+        else:
+            shap_values, base_value = compute_shap_values(artifacts, data_point_transformed)
+        top_features = top_shap_features(artifacts["transformed_feature_names"], shap_values[0], params["num_features"])
+        shap_explanation = {**top_features, "base_value": base_value, "explainer_type": artifacts["shap_explainer_type"]}
+        if report is not None:
+            # Variance of each reported attribution, in the order of "features"
+            position = {name: i for i, name in enumerate(artifacts["transformed_feature_names"])}
+            if report["variance"] is not None:
+                report["variance"] = [float(report["variance"][position[name]]) for name in top_features["features"]]
+            shap_explanation["sampling"] = report
+    except Exception as e:
+        logger.error(f"SHAP explanation failed: {e}")
+        failed = True
+        shap_explanation = {"features": ["Error"], "shap_values": [0], "base_value": 0, "explainer_type": "ErrorFallback", "reliability_score": 0.1}
 
+    try:
+        processed_lime_exp = compute_lime_explanations(model_data, artifacts, data_point_df, params)[0]
+        lime_explanation = {"lime_explanation": processed_lime_exp}
+    except Exception as e:
+        logger.error(f"LIME explanation failed: {e}")
+        failed = True
+        lime_explanation = {"lime_explanation": {"Error": 0}, "reliability_score": 0.1}
+    return shap_explanation, lime_explanation, failed
+
+def explain_model_service(request: ExplainRequest, compute: Callable[..., Tuple[Dict[str, Any], Dict[str, Any], bool]] = explain_data_point):
+    """The core service for generating explanations with feedback-based adjustments.
+
+    compute does the SHAP/LIME work, in this process by default; the explanation
+    worker pool passes one that runs it in a worker process.
+    """
+    try:
+        model_data = get_model_data(request.model_id)
+        if not model_data:
+            raise ValueError("Model not found. Please train the model first.")
+        
+        label_metrics(model_data)
+        params = get_explanation_parameters(request.model_id)
+        data_point_df = prepare_data_frame(model_data, pd.DataFrame([request.data_point]))
+
+        sampling = None
+        if request.shap_tolerance is not None or request.latency_budget_ms is not None:
+            sampling = {"tolerance": request.shap_tolerance or SHAP_TOLERANCE, "latency_budget_ms": request.latency_budget_ms}
+
+        # Identical requests share one stored explanation; only reliability scores move with feedback
+        explanation_id = explanation_store.explanation_key(request.model_id, data_point_df.iloc[0].to_dict(), params if sampling is None else {**params, "sampling": sampling})
+        stored = explanation_store.get(explanation_id)
+        if stored is not None:
+            return with_current_reliability(request.model_id, stored, explanation_id)
+
+        shap_explanation, lime_explanation, failed = compute(request.model_id, request.data_point, params, sampling)
+        shap_explanation.setdefault("reliability_score", calculate_reliability_score(request.model_id, "shap"))
+        lime_explanation.setdefault("reliability_score", calculate_reliability_score(request.model_id, "lime"))
         overall_reliability = calculate_reliability_score(request.model_id, "both")
-        explanation_id = str(uuid.uuid4())
-        EXPLANATION_CACHE[explanation_id] = {"model_id": request.model_id, "shap": shap_explanation, "lime": lime_explanation, "overall_reliability": overall_reliability, "timestamp": datetime.now().isoformat(), "parameters_used": params}
+        if failed:
+            # Failures may be transient, so they get a one-off id and are not stored
+            explanation_id = str(uuid.uuid4())
+        else:
+            explanation_store.put(explanation_id, {"model_id": request.model_id, "shap": shap_explanation, "lime": lime_explanation, "overall_reliability": overall_reliability, "timestamp": datetime.now().isoformat(), "parameters_used": params})
         return {"shap": shap_explanation, "lime": lime_explanation, "overall_reliability": overall_reliability, "explanation_id": explanation_id}
+    except TimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Explanation service error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to generate explanation.")
 
+def iter_batch_explanations(model_id: str, chunks: Iterable[pd.DataFrame], top_k: Optional[int] = None, include_lime: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Explains rows chunk by chunk, yielding ("row", result) per row and a final ("summary", aggregate).
+
+    Each chunk gets one transform, one SHAP call and one batched LIME prediction, so memory
+    stays bounded by the chunk size rather than the number of rows.
+    """
+    model_data = get_model_data(model_id)
+    if not model_data:
+        raise ValueError("Model not found. Please train the model first.")
+    label_metrics(model_data)
+    params = get_explanation_parameters(model_id)
+    top_k = top_k or params["num_features"]
+    preprocessor = model_data["pipeline"].named_steps['preprocessor']
+    artifacts = explainers.get_explainer_artifacts(model_id, model_data, params)
+    transformed_feature_names = artifacts["transformed_feature_names"]
+
+    def generate():
+        n_rows = 0
+        base_value = 0.0
+        abs_shap_sum = np.zeros(len(transformed_feature_names))
+        shap_sum = np.zeros(len(transformed_feature_names))
+        lime_totals: Dict[str, float] = {}
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            with metrics.span("preprocess"):
+                data = prepare_data_frame(model_data, chunk)
+                X_transformed = preprocessor.transform(data)
+            shap_values, base_value = compute_shap_values(artifacts, X_transformed)
+            abs_shap_sum += np.abs(shap_values).sum(axis=0)
+            shap_sum += shap_values.sum(axis=0)
+            lime_results = compute_lime_explanations(model_data, artifacts, data, params) if include_lime else None
+            for i in range(len(data)):
+                row = {"row": n_rows + i, "shap": top_shap_features(transformed_feature_names, shap_values[i], top_k)}
+                if lime_results is not None:
+                    for name, value in lime_results[i].items():
+                        lime_totals[name] = lime_totals.get(name, 0.0) + abs(value)
+                    row["lime"] = dict(sorted(lime_results[i].items(), key=lambda x: abs(x[1]), reverse=True)[:top_k])
+                yield "row", row
+            n_rows += len(data)
+        if n_rows == 0:
+            raise ValueError("No data points provided.")
+
+        mean_abs_shap = abs_shap_sum / n_rows
+        mean_shap = shap_sum / n_rows
+        order = np.argsort(-mean_abs_shap)[:top_k]
+        aggregate = {
+            "rows": n_rows, "base_value": base_value, "explainer_type": artifacts["shap_explainer_type"],
+            "mean_abs_shap": {transformed_feature_names[j]: float(mean_abs_shap[j]) for j in order},
+            "mean_shap": {transformed_feature_names[j]: float(mean_shap[j]) for j in order},
+        }
+        if include_lime:
+            aggregate["mean_abs_lime"] = dict(sorted(((name, total / n_rows) for name, total in lime_totals.items()), key=lambda x: x[1], reverse=True)[:top_k])
+        logger.info(f"Explained {n_rows} rows for model {model_id}")
+        yield "summary", {"model_id": model_id, "aggregate": aggregate, "parameters_used": params}
+
+    return generate()
+
+def chunk_frame(data: pd.DataFrame, chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Splits a frame into consecutive row chunks."""
+    for start in range(0, len(data), chunk_size):
+        yield data.iloc[start:start + chunk_size]
+
+def explain_batch_service(model_id: str, data: pd.DataFrame, top_k: Optional[int] = None, include_lime: bool = True):
+    """Explains many rows at once: one transform, one SHAP call and batched LIME predictions per chunk."""
+    rows = []
+    summary = {}
+    for kind, payload in iter_batch_explanations(model_id, chunk_frame(data), top_k, include_lime):
+        if kind == "row":
+            rows.append(payload)
+        else:
+            summary = payload
+    return {"model_id": model_id, "rows": rows, "aggregate": summary["aggregate"], "parameters_used": summary["parameters_used"]}
+
 def handle_feedback_service(request: FeedbackRequest):
     """Handle user feedback and update model parameters."""
     try:
-        if request.model_id not in MODELS_CACHE:
+        model_data = get_model_data(request.model_id)
+        if model_data is None:
             raise ValueError("Model not found")
-        if request.model_id not in FEEDBACK_CACHE:
-            FEEDBACK_CACHE[request.model_id] = []
-        feedback_entry = {"rating": request.rating, "comment": request.comment, "explanation_type": request.explanation_type, "explanation_id": request.explanation_id, "timestamp": datetime.now().isoformat()}
-        FEEDBACK_CACHE[request.model_id].append(feedback_entry)
-        updated_reliability = calculate_reliability_score(request.model_id, request.explanation_type)
-        all_feedback = FEEDBACK_CACHE[request.model_id]
-        avg_rating = sum(f['rating'] for f in all_feedback) / len(all_feedback)
-        comments = [f['comment'] for f in all_feedback if f['comment']]
-        suggestions = get_improvement_suggestions(avg_rating, comments)
+        stats = get_feedback_stats(request.model_id)
+        with _FEEDBACK_LOCK:
+            if model_data.get("stored_bytes") is None:
+                # Never reached the model store, so the aggregates live in this process only
+                feedback.record(stats, request.rating, request.explanation_type, request.comment)
+            else:
+                # Fold into the stored aggregates, which include feedback other workers recorded
+                with model_store.artifact_lock(request.model_id, "feedback_stats"):
+                    stats = model_store.load_artifact(request.model_id, "feedback_stats") or stats
+                    feedback.record(stats, request.rating, request.explanation_type, request.comment)
+                    try:
+                        model_store.save_artifact(request.model_id, "feedback_stats", stats)
+                    except Exception as e:
+                        logger.error(f"Could not persist feedback aggregates for model {request.model_id}: {e}")
+                FEEDBACK_STATS[request.model_id] = stats
+            snapshot = copy.deepcopy(stats)
+        updated_reliability = feedback.reliability_score(snapshot, request.explanation_type)
+        avg_rating = feedback.average_rating(snapshot)
+        # Explainers built for parameters the new rating no longer selects are stale
+        explainers.invalidate_explainers(request.model_id, keep_params=adjust_explanation_parameters(request.model_id, avg_rating))
+        suggestions = get_improvement_suggestions(avg_rating, snapshot["keywords"])
         logger.info(f"Feedback received for model {request.model_id}: Rating {request.rating}, Updated reliability: {updated_reliability}")
         return {"message": "Feedback has been received successfully. Explanation parameters have been updated according to your input", "updated_reliability": updated_reliability, "improvement_suggestions": suggestions}
     except Exception as e:
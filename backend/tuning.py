@@ -0,0 +1,166 @@
+import logging
+import math
+import os
+import time
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TUNING_JOBS = int(os.getenv("XAI_TUNING_JOBS", str(os.cpu_count() or 1)))  # Processes scoring candidates in parallel
+HALVING_FACTOR = 3  # Successive halving keeps a third of the candidates per round, on three times the rows
+MIN_HALVING_ROWS = 50  # Rows per fold in the first halving round, at least
+
+# Hyperparameters sampled per model type; every key is valid for both the classifier and the regressor
+SEARCH_SPACES: Dict[str, Dict[str, List[Any]]] = {
+    "random_forest": {"n_estimators": [10, 25, 50, 100, 200], "max_depth": [3, 5, 8, 12, None], "min_samples_leaf": [1, 2, 5, 10], "max_features": ["sqrt", 0.5, 1.0]},
+    "decision_tree": {"max_depth": [3, 5, 8, 12, None], "min_samples_leaf": [1, 2, 5, 10, 20], "max_features": [None, "sqrt", 0.5]},
+    "logistic_regression": {"C": [0.001, 0.01, 0.1, 1.0, 10.0, 100.0], "class_weight": [None, "balanced"]},
+    "svm": {"C": [0.01, 0.1, 1.0, 10.0, 100.0]},
+    "linear_regression": {"fit_intercept": [True, False], "positive": [False, True]},
+}
+
+def _candidate_estimator(model, params: Dict[str, Any]):
+    """A fresh copy of the estimator with candidate params, sized for running many side by side."""
+    from sklearn.base import clone
+    estimator = clone(model).set_params(**params)
+    available = estimator.get_params()
+    if "n_jobs" in available:
+        estimator.set_params(n_jobs=1)
+    if available.get("probability"):
+        # Scoring uses predict; Platt scaling is only needed by the final model
+        estimator.set_params(probability=False)
+    return estimator
+
+def _score_candidate(candidate: int, model, params: Dict[str, Any], X_train, y_train, X_valid, y_valid) -> Tuple[int, float]:
+    """Validation score of one candidate on one fold; NaN when the candidate can't be fitted."""
+    try:
+        return candidate, float(_candidate_estimator(model, params).fit(X_train, y_train).score(X_valid, y_valid))
+    except Exception:
+        return candidate, float("nan")
+
+def _transformed_folds(preprocessor, X: pd.DataFrame, y: np.ndarray, problem_type: str, cv_folds: int) -> List[Tuple[Any, np.ndarray, Any, np.ndarray]]:
+    """Fits the preprocessor once per fold and returns (X_train, y_train, X_valid, y_valid) per fold.
+
+    Candidates only fit the estimator on these cached matrices. Training rows are
+    shuffled so that any prefix is a random subsample for successive halving.
+    """
+    from sklearn.base import clone
+    from sklearn.model_selection import KFold, StratifiedKFold
+    stratify = problem_type == "classification" and pd.Series(y).value_counts().min() >= cv_folds
+    splitter = (StratifiedKFold if stratify else KFold)(n_splits=cv_folds, shuffle=True, random_state=42)
+    rng = np.random.default_rng(42)
+    folds = []
+    for train_pos, valid_pos in splitter.split(np.zeros(len(y)), y if stratify else None):
+        train_pos = rng.permutation(train_pos)
+        fold_preprocessor = clone(preprocessor)
+        X_train = fold_preprocessor.fit_transform(X.iloc[train_pos], y[train_pos])
+        folds.append((X_train, y[train_pos], fold_preprocessor.transform(X.iloc[valid_pos]), y[valid_pos]))
+    return folds
+
+def _round_rows(strategy: str, n_candidates: int, fold_rows: int) -> List[int]:
+    """Training rows per fold for each search round."""
+    if strategy != "halving" or n_candidates < HALVING_FACTOR:
+        return [fold_rows]
+    rounds = 1 + int(math.log(n_candidates, HALVING_FACTOR))
+    rows = [max(min(MIN_HALVING_ROWS, fold_rows), fold_rows // HALVING_FACTOR ** (rounds - 1 - i)) for i in range(rounds)]
+    # Drop leading rounds that would run on the same rows as the next one
+    return [r for i, r in enumerate(rows) if i == len(rows) - 1 or r < rows[i + 1]]
+
+def search(model, model_type: str, problem_type: str, preprocessor, X: pd.DataFrame, y: pd.Series, strategy: str = "halving", n_candidates: int = 20, cv_folds: int = 3, time_budget_seconds: Optional[float] = None, is_cancelled: Optional[Callable[[], bool]] = None, progress: Optional[Callable[[float], None]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Cross-validated search over SEARCH_SPACES[model_type] for model, on the training split X, y.
+
+    strategy "random" scores every sampled candidate on all rows of every fold; "halving"
+    starts all candidates on a subsample and keeps the best third, on three times the rows,
+    each round. Fold scores run in parallel on TUNING_JOBS processes. Scoring stops early
+    once time_budget_seconds have passed or is_cancelled() is true, keeping the best
+    candidate scored on the most rows so far. Returns the best parameters, empty when no
+    candidate finished, and a report of the search.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import ParameterSampler
+
+    started = time.perf_counter()
+    space = SEARCH_SPACES.get(model_type, {})
+    candidates = list(ParameterSampler(space, n_iter=n_candidates, random_state=42)) if space else [{}]
+    y_values = np.asarray(y)
+    with metrics.span("train.tune.preprocess"):
+        folds = _transformed_folds(preprocessor, X, y_values, problem_type, cv_folds)
+    round_rows = _round_rows(strategy, len(candidates), min(len(fold[1]) for fold in folds))
+
+    def out_of_time() -> bool:
+        return (time_budget_seconds is not None and time.perf_counter() - started > time_budget_seconds) or (is_cancelled is not None and is_cancelled())
+
+    alive = list(range(len(candidates)))
+    results: Dict[int, Dict[str, Any]] = {}
+    evaluations = 0
+    rounds_completed = 0
+    stopped = "completed"
+    total_tasks = sum(math.ceil(len(candidates) / HALVING_FACTOR ** i) for i in range(len(round_rows))) * len(folds)
+    with metrics.span("train.tune.search"):
+        for rows in round_rows:
+            tasks = [(c, f) for c in alive for f in range(len(folds))]
+            scores: Dict[int, List[float]] = {c: [] for c in alive}
+            outputs = Parallel(n_jobs=min(TUNING_JOBS, len(tasks)), return_as="generator_unordered")(
+                delayed(_score_candidate)(c, model, candidates[c], folds[f][0][:rows], folds[f][1][:rows], folds[f][2], folds[f][3])
+                for c, f in tasks
+            )
+            for c, score in outputs:
+                scores[c].append(score)
+                evaluations += 1
+                if progress is not None:
+                    progress(min(1.0, evaluations / total_tasks))
+                if out_of_time():
+                    stopped = "cancelled" if is_cancelled is not None and is_cancelled() else "time_budget"
+                    break
+            del outputs  # cancels fold scores not started yet
+            finished = {c: s for c, s in scores.items() if len(s) == len(folds) and not np.isnan(s).any()}
+            if finished:
+                results = {c: {"params": candidates[c], "rows": rows, "mean_score": float(np.mean(s)), "std_score": float(np.std(s))} for c, s in finished.items()}
+            if stopped != "completed":
+                break
+            rounds_completed += 1
+            ranked = sorted(finished, key=lambda c: results[c]["mean_score"], reverse=True)
+            alive = ranked[:max(1, math.ceil(len(alive) / HALVING_FACTOR))]
+            if not alive:
+                break
+
+    leaderboard = sorted(results.values(), key=lambda r: r["mean_score"], reverse=True)
+    best_params = dict(leaderboard[0]["params"]) if leaderboard else {}
+    report = {
+        "strategy": strategy, "scoring": "accuracy" if problem_type == "classification" else "r2",
+        "cv_folds": len(folds), "candidates": len(candidates), "evaluations": evaluations,
+        "rounds": rounds_completed, "rows_per_round": round_rows,
+        "best_params": best_params, "best_cv_score": leaderboard[0]["mean_score"] if leaderboard else None,
+        "stopped": stopped, "time_budget_seconds": time_budget_seconds,
+        "elapsed_seconds": round(time.perf_counter() - started, 3), "leaderboard": leaderboard[:5],
+    }
+    logger.info(f"Tuned {model_type}: {report['evaluations']} fold scores, best {best_params} ({report['best_cv_score']}), stopped: {stopped}")
+    return best_params, report
+
+def score_test_split(pipeline, X_test: pd.DataFrame, y_test: pd.Series, problem_type: str) -> Dict[str, float]:
+    """Held-out metrics of a fitted pipeline: accuracy, weighted F1 and binary ROC AUC, or R2, MAE and RMSE."""
+    from sklearn import metrics as sk_metrics
+    if len(X_test) == 0:
+        return {}
+    predictions = pipeline.predict(X_test)
+    if problem_type != "classification":
+        return {
+            "r2": float(sk_metrics.r2_score(y_test, predictions)),
+            "mae": float(sk_metrics.mean_absolute_error(y_test, predictions)),
+            "rmse": float(np.sqrt(sk_metrics.mean_squared_error(y_test, predictions))),
+        }
+    y_true = np.asarray(y_test).astype(str)
+    scores = {
+        "accuracy": float(sk_metrics.accuracy_score(y_true, np.asarray(predictions).astype(str))),
+        "f1_weighted": float(sk_metrics.f1_score(y_true, np.asarray(predictions).astype(str), average="weighted")),
+    }
+    classes = getattr(pipeline, "classes_", None)
+    if classes is not None and len(classes) == 2 and hasattr(pipeline, "predict_proba") and len(set(y_true)) == 2:
+        scores["roc_auc"] = float(sk_metrics.roc_auc_score(y_true == str(classes[1]), pipeline.predict_proba(X_test)[:, 1]))
+    return scores
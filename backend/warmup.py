@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import explain_workers
+import explainers
+import model_store
+import services
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WARMUP = os.getenv("XAI_WARMUP", "0") == "1"  # Preload stored models and their explainers before reporting ready
+WARMUP_MODELS = int(os.getenv("XAI_WARMUP_MODELS", "4"))  # Most recently stored models to preload
+
+# Readiness of this API process: starting -> loading_libraries -> warming -> ready, or failed
+STATE: Dict[str, Any] = {"status": "starting", "started_at": None, "ready_at": None, "warmed_models": [], "explain_workers": 0, "error": None}
+
+_thread: Optional[threading.Thread] = None
+
+def _run():
+    started = time.perf_counter()
+    try:
+        STATE["status"] = "loading_libraries"
+        explainers.load_libraries()
+        model_ids = model_store.list_models(newest_first=True)[:WARMUP_MODELS] if WARMUP else []
+        STATE["status"] = "warming"
+        for model_id in model_ids:
+            try:
+                # Explainers are built where explanations run: here only without worker processes
+                services.warm_up_model(model_id, build_explainers=explain_workers.EXPLAIN_WORKERS <= 0)
+                STATE["warmed_models"].append(model_id)
+            except Exception as e:
+                logger.warning(f"Could not warm up model {model_id}: {e}")
+        explain_workers.start(STATE["warmed_models"])
+        STATE["explain_workers"] = max(0, explain_workers.EXPLAIN_WORKERS)
+        STATE["status"] = "ready"
+        STATE["ready_at"] = datetime.now().isoformat()
+        logger.info(f"Ready after {time.perf_counter() - started:.2f}s with {len(STATE['warmed_models'])} warmed models")
+    except Exception as e:
+        logger.error(f"Startup failed: {e}", exc_info=True)
+        STATE["status"] = "failed"
+        STATE["error"] = str(e)
+
+def start():
+    """Loads the explanation libraries, starts the explanation workers and, with XAI_WARMUP=1,
+    warms up the most recently stored models, all in the background.
+
+    The API serves requests meanwhile; is_ready() turns true once it can explain without cold starts.
+    """
+    global _thread
+    if _thread is not None:
+        return
+    STATE["started_at"] = datetime.now().isoformat()
+    _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    _thread.start()
+
+def is_ready() -> bool:
+    return STATE["status"] == "ready"
+
+def readiness() -> Dict[str, Any]:
+    """Startup state for the readiness endpoint."""
+    return {**STATE, "warmed_models": list(STATE["warmed_models"])}